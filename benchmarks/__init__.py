@@ -0,0 +1,31 @@
+"""
+benchmarks
+
+Micro-benchmarks of the hot paths of the app. Run
+them from the project root, e.g.:
+
+    python -m benchmarks.policy
+"""
+import os
+import timeit
+
+
+def setup():
+    """
+    Configure Django using the
+    test project settings.
+    """
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'permproject.settings')
+    django.setup()
+
+
+def report(name, func, number=100000):
+    """
+    Print the cost per call of "func"
+    and return it in microseconds.
+    """
+    elapsed = min(timeit.repeat(func, number=number, repeat=3))
+    result = elapsed / number * 1e6
+    print('%-40s %10.3f us/call' % (name, result))
+    return result
@@ -0,0 +1,54 @@
+"""
+Compare the cost of generating the cache keys
+using the generation counters against the
+previous md5 digest over str(user) and str(obj).
+"""
+from benchmarks import report, setup
+
+
+def legacy_cache_key(user, obj, any_object):
+    from hashlib import md5
+
+    key = md5()
+    str_key = str(user.__class__) + str(user) + str(user.id)
+    if obj:
+        str_key += str(obj.__class__) + str(obj) + str(obj.id)
+    elif any_object:
+        str_key += 'any'
+    key.update(str_key.encode('utf-8'))
+    return 'dip-userrole-{}'.format(key.hexdigest())
+
+
+def main():
+    setup()
+    from django.contrib.contenttypes.models import ContentType
+    from django.db import connection
+    from improved_permissions.utils import (generate_cache_key, get_generations,
+                                            permission_memo)
+    from testapp1.models import MyUser
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        user = MyUser(id=1, username='john')
+        obj = MyUser(id=2, username='bob')
+
+        # Avoid the ContentType queries.
+        ContentType.objects.get_for_model(MyUser)
+
+        legacy = report('md5 over str(user) and str(obj)', lambda: legacy_cache_key(user, obj, False))
+        generations = get_generations([user, obj])
+        known = report('generations already fetched',
+                       lambda: generate_cache_key(user, obj, False, dict(generations)))
+        fetched = report('generations fetched from the cache', lambda: generate_cache_key(user, obj, False))
+        with permission_memo():
+            memo = report('generations from the memo layer', lambda: generate_cache_key(user, obj, False))
+
+        print('speedup (generations already fetched): %.1fx' % (legacy / known))
+        print('speedup (generations fetched from the cache): %.1fx' % (legacy / fetched))
+        print('speedup (generations from the memo layer): %.1fx' % (legacy / memo))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Compare "get_users" using a semi-join subquery
+against the previous join over the reverse
+relation "roles" plus DISTINCT, on a synthetic
+dataset with a popular object. The query plans
+of both versions are printed as well.
+
+The dataset lives in a temporary test database.
+"""
+from benchmarks import report, setup
+
+USERS_COUNT = 20000
+AUTHORS_COUNT = 5000
+
+
+def legacy_get_users(role_class, obj):
+    from django.contrib.auth import get_user_model
+    from django.contrib.contenttypes.models import ContentType
+
+    ct_obj = ContentType.objects.get_for_model(obj)
+    kwargs = {
+        'roles__role_class': role_class.get_class_name(),
+        'roles__content_type': ct_obj.id,
+        'roles__object_id': obj.id,
+    }
+    return get_user_model().objects.filter(**kwargs).distinct()
+
+
+def explain(name, query):
+    from django.db import connection
+
+    sql, params = query.query.sql_with_params()
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        print('%s:' % name)
+        for row in cursor.fetchall():
+            print('    %s' % ' '.join(str(item) for item in row))
+
+
+def main():
+    setup()
+    from django.db import connection
+    from improved_permissions.roles import RoleManager
+    from improved_permissions.shortcuts import bulk_assign_roles, get_user_ids, get_users
+    from testapp1.models import Book, MyUser
+    from testapp1.roles import Author, Reviewer
+    from testapp2.models import Library
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        RoleManager.cleanup()
+        RoleManager.register_roles([Author, Reviewer])
+
+        MyUser.objects.bulk_create(MyUser(username='user%d' % i) for i in range(USERS_COUNT))
+        users_list = list(MyUser.objects.order_by('pk'))
+        library = Library.objects.create(title='Library')
+        book = Book.objects.create(title='Popular Book', library=library)
+        other = Book.objects.create(title='Other Book', library=library)
+
+        # Each author of the popular book is also
+        # reviewer, so the join finds duplicates.
+        bulk_assign_roles(users_list[:AUTHORS_COUNT], Author, [book])
+        bulk_assign_roles(users_list[:AUTHORS_COUNT], Reviewer, [book])
+        bulk_assign_roles(users_list[AUTHORS_COUNT:], Author, [other])
+
+        assert (sorted(legacy_get_users(Author, book).values_list('pk', flat=True)) ==
+                sorted(get_users(Author, book).values_list('pk', flat=True)) ==
+                sorted(get_user_ids(Author, book)))
+
+        explain('join + DISTINCT (legacy)', legacy_get_users(Author, book))
+        explain('semi-join subquery', get_users(Author, book))
+        explain('ids only', get_user_ids(Author, book))
+
+        # The count leaves the cost of
+        # the instances out.
+        before_count = report('get_users count (legacy)', lambda: legacy_get_users(Author, book).count(), number=10)
+        after_count = report('get_users count (semi-join)', lambda: get_users(Author, book).count(), number=10)
+        before = report('get_users (legacy)', lambda: list(legacy_get_users(Author, book)), number=10)
+        after = report('get_users (semi-join)', lambda: list(get_users(Author, book)), number=10)
+        ids = report('get_user_ids', lambda: list(get_user_ids(Author, book)), number=10)
+        print('speedup of the query: %.1fx' % (before_count / after_count))
+        print('speedup: %.1fx' % (before / after))
+        print('speedup using ids only: %.1fx' % (before / ids))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
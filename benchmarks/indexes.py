@@ -0,0 +1,91 @@
+"""
+Print the query plans of the hot queries on the
+UserRole and RolePermission tables, captured from
+the functions which run them, in order to check
+which index each one uses.
+
+The dataset lives in a temporary test database.
+"""
+from benchmarks import setup
+
+USERS_COUNT = 2000
+
+
+def explain(name, sql, params):
+    from django.db import connection
+
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        rows = cursor.fetchall()
+
+    print('%s:' % name)
+    print('    %s' % sql[:160])
+    for row in rows:
+        print('    -> %s' % ' '.join(str(item) for item in row))
+
+
+def capture(name, func):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from improved_permissions.utils import dip_cache
+
+    dip_cache().clear()
+    with CaptureQueriesContext(connection) as context:
+        func()
+
+    # The captured SQL has the
+    # parameters already inlined.
+    for index, query in enumerate(context.captured_queries):
+        sql = query['sql']
+        if sql.startswith('SELECT') and 'improved_permissions_' in sql:
+            explain('%s #%d' % (name, index + 1), sql, ())
+
+
+def main():
+    setup()
+    from django.db import connection
+    from improved_permissions import shortcuts
+    from improved_permissions.roles import RoleManager
+    from improved_permissions.utils import flush_cleanup, get_object_key
+    from testapp1.models import Book, MyUser
+    from testapp1.roles import Advisor, Author, Coordenator, Reviewer
+    from testapp2.models import Library
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        RoleManager.cleanup()
+        RoleManager.register_roles([Advisor, Author, Coordenator, Reviewer])
+
+        MyUser.objects.bulk_create(MyUser(username='user%d' % i) for i in range(USERS_COUNT))
+        users_list = list(MyUser.objects.order_by('pk'))
+        library = Library.objects.create(title='Library')
+        books_list = [Book.objects.create(title='Book %d' % i, library=library) for i in range(50)]
+
+        shortcuts.bulk_assign_roles(users_list, Author, books_list[:5])
+        shortcuts.bulk_assign_roles(users_list[:100], Reviewer, books_list)
+        shortcuts.bulk_assign_roles(users_list[:500], Coordenator, [None])
+        for user, obj in zip(users_list, users_list[1:200]):
+            shortcuts.assign_role(user, Advisor, obj)
+        connection.cursor().execute('ANALYZE')
+
+        user = users_list[0]
+        book = books_list[0]
+        capture('has_permission on an object', lambda: shortcuts.has_permission(user, 'testapp1.view_book', book))
+        capture('has_permission without object', lambda: shortcuts.has_permission(user, 'testapp1.view_book'))
+        capture('has_role on an object', lambda: shortcuts.has_role(user, Author, book))
+        capture('filter_queryset', lambda: list(shortcuts.filter_queryset(user, 'testapp1.view_book',
+                                                                            Book.objects.all())))
+        capture('get_user', lambda: shortcuts.get_user(obj=users_list[1]))
+        capture('get_users of an object', lambda: list(shortcuts.get_users(Author, book)))
+        capture('get_users of a role', lambda: list(shortcuts.get_user_ids(Coordenator)))
+        capture('get_objects', lambda: shortcuts.get_objects(user, Reviewer))
+        capture('cleanup of deleted objects', lambda: flush_cleanup([get_object_key(books_list[-1])], 'default'))
+        capture('remove_all', lambda: shortcuts.remove_all(Reviewer, books_list[-2]))
+        capture('delete of a user', lambda: users_list[-1].delete())
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Compare the cost of "inherit_check" using the
+compiled RolePolicy against the previous
+implementation, which scanned the list of
+role classes and the permission lists.
+"""
+from benchmarks import report, setup
+
+
+def legacy_inherit_check(role_s, permission):
+    from improved_permissions.exceptions import RoleNotFound
+    from improved_permissions.roles import ALLOW_MODE, RoleManager
+
+    for role in RoleManager.get_roles():
+        if role.get_class_name() == role_s:
+            break
+    else:
+        raise RoleNotFound(role_s)
+
+    if role.inherit is True:
+        if role.get_inherit_mode() == ALLOW_MODE:
+            return permission in role.inherit_allow
+        return permission not in role.inherit_deny
+    return False
+
+
+def main():
+    setup()
+    from improved_permissions.roles import RoleManager
+    from improved_permissions.utils import inherit_check
+    from testapp1 import roles
+    from testapp2 import roles as roles2
+
+    RoleManager.cleanup()
+    for role in [roles.Author, roles.Reviewer, roles.Advisor, roles.Coordenator,
+                 roles2.LibraryOwner, roles2.LibraryWorker]:
+        RoleManager.register_role(role)
+
+    # The last registered role is the worst
+    # case for the linear scan.
+    args = ('libraryowner', 'testapp1.review')
+    assert legacy_inherit_check(*args) == inherit_check(*args)
+
+    before = report('inherit_check (legacy)', lambda: legacy_inherit_check(*args))
+    after = report('inherit_check (RolePolicy)', lambda: inherit_check(*args))
+    print('speedup: %.1fx' % (before / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Compare the cost of "get_roleclass" using the
+indexed RoleManager registry against the previous
+implementation, which copied and scanned the list
+of role classes, in a project with hundreds of
+role classes.
+"""
+from benchmarks import report, setup
+
+ROLES_COUNT = 500
+
+
+def legacy_get_roleclass(role_class):
+    from improved_permissions.exceptions import RoleNotFound
+    from improved_permissions.roles import RoleManager
+
+    roles_list = RoleManager.get_roles()
+    if isinstance(role_class, str):
+        for role in roles_list:
+            if role.get_class_name() == role_class:
+                return role
+    elif role_class in roles_list:
+        return role_class
+    raise RoleNotFound(role_class)
+
+
+def main():
+    setup()
+    from improved_permissions.roles import Role, RoleManager
+    from improved_permissions.utils import get_roleclass
+    from testapp1.models import MyUser
+
+    roles_list = list()
+    for index in range(ROLES_COUNT):
+        attrs = {'verbose_name': 'Role %d' % index, 'models': [MyUser], 'deny': []}
+        roles_list.append(type('BenchRole%d' % index, (Role,), attrs))
+
+    RoleManager.cleanup()
+    RoleManager.register_roles(roles_list)
+
+    # The last registered role is the worst
+    # case for the linear scan.
+    last = roles_list[-1]
+    name = last.get_class_name()
+    assert legacy_get_roleclass(name) is get_roleclass(name) is last
+
+    results = list()
+    for label, arg in [('name', name), ('class', last)]:
+        before = report('get_roleclass by %s (legacy)' % label,
+                        lambda: legacy_get_roleclass(arg), number=2000)
+        after = report('get_roleclass by %s (index)' % label,
+                       lambda: get_roleclass(arg), number=2000)
+        results.append((label, before / after))
+
+    for label, speedup in results:
+        print('speedup by %s: %.1fx' % (label, speedup))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
 """ permissions configs """
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
-from improved_permissions.utils import autodiscover, register_cleanup
+from improved_permissions.utils import autodiscover, clear_registry
 
 
 class ImprovedPermissionsConfig(AppConfig):
@@ -9,5 +10,5 @@ class ImprovedPermissionsConfig(AppConfig):
     verbose_name = 'Django Improved Permissions'
 
     def ready(self):
-        register_cleanup()
+        post_migrate.connect(clear_registry, dispatch_uid='dip_clear_registry')
         autodiscover()
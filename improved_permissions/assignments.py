@@ -1,14 +1,28 @@
 """assignments functions"""
+# pylint: disable=too-many-lines
+from collections import OrderedDict
+
+from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, router, transaction
 
 from improved_permissions.exceptions import (InvalidPermissionAssignment,
                                              InvalidRoleAssignment)
-from improved_permissions.getters import get_roles, get_users
 from improved_permissions.models import RolePermission, UserRole
 from improved_permissions.roles import ALL_MODELS
-from improved_permissions.utils import (check_my_model, delete_from_cache,
-                                        get_roleclass, is_unique_together,
-                                        string_to_permission)
+from improved_permissions.utils import (check_my_model, chunks,
+                                        delete_from_cache,
+                                        delete_many_on_commit,
+                                        get_object_key, get_permission_id,
+                                        get_roleclass, has_unique_constraints,
+                                        is_unique_together, objects_condition)
+
+
+# Size of the chunks of objects and users
+# filtered by the same query, keeping both
+# below the limit of 999 parameters of the
+# older SQLite versions.
+CHUNK_SIZE = 400
 
 
 def assign_role(user, role_class, obj=None):
@@ -25,61 +39,169 @@ def assign_roles(users_list, role_class, obj=None):
     referencing the followling role_class to the
     user.
     """
-    users_set = set(users_list)
+    bulk_assign_roles(users_list, role_class, [obj])
+
+
+def bulk_assign_roles(users_list, role_class, objs_list):
+    """
+    Assign the role class to all users in
+    "users_list" for each object in "objs_list".
+
+    All UserRole and RolePermission instances are
+    created using a fixed number of queries inside
+    a single transaction. The unique rules are
+    enforced by the database constraints, or checked
+    before any change if they are not supported.
+
+    The instances are created by "bulk_create", so
+    the "post_save" signal is not sent for them.
+    """
+    users_list = list(OrderedDict((get_object_key(user), user) for user in users_list).values())
+    objs_dict = OrderedDict((get_object_key(obj) if obj else None, obj) for obj in objs_list)
     role = get_roleclass(role_class)
     name = role.get_verbose_name()
 
-    # Check if object belongs
-    # to the role class.
-    check_my_model(role, obj)
+    for obj in objs_dict.values():
+        # Check if object belongs
+        # to the role class.
+        check_my_model(role, obj)
 
-    # If no object is provided but the role needs specific models.
-    if not obj and role.models != ALL_MODELS:
-        raise InvalidRoleAssignment(
-            'The role "%s" must be assigned with a object.' % name
-        )
+        # If no object is provided but the role needs specific models.
+        if not obj and role.models != ALL_MODELS:
+            raise InvalidRoleAssignment(
+                'The role "%s" must be assigned with a object.' % name
+            )
+
+        # If a object is provided but the role does not needs a object.
+        if obj and role.models == ALL_MODELS:
+            raise InvalidRoleAssignment(
+                'The role "%s" must not be assigned with a object.' % name
+            )
 
-    # If a object is provided but the role does not needs a object.
-    if obj and role.models == ALL_MODELS:
+    if not users_list or not objs_dict:
+        return
+
+    # If the role is marked as unique but multiple users are provided.
+    if role.unique is True and len(users_list) > 1:
         raise InvalidRoleAssignment(
-            'The role "%s" must not be assigned with a object.' % name
+            'Multiple users were provided using "%s", '
+            'but it is marked as unique.' % name
         )
 
+    # The database enforces the unique rules
+    # by itself if it supports the constraints.
+    if not has_unique_constraints():
+        check_unique_rules(users_list, role, objs_dict)
+
+    ur_instances = build_user_roles(users_list, role, objs_dict)
+    accesses = UserRole.get_accesses(role)
+    using = router.db_for_write(UserRole)
+    try:
+        with transaction.atomic(using=using):
+            UserRole.objects.using(using).bulk_create(ur_instances)
+
+            if accesses:
+                # Some databases do not return
+                # the ids from "bulk_create".
+                ids_list = [ur_obj.pk for ur_obj in ur_instances]
+                if None in ids_list:
+                    ids_list = list()
+                    query = UserRole.objects.using(using).filter(role_class=role.get_class_name())
+                    for keys_chunk in chunks(list(objs_dict), CHUNK_SIZE):
+                        for users_chunk in chunks(users_list, CHUNK_SIZE):
+                            ids_list.extend(query
+                                            .filter(objects_condition(keys_chunk), user__in=users_chunk)
+                                            .values_list('id', flat=True))
+
+                RolePermission.objects.using(using).bulk_create([
+                    RolePermission(role_id=ur_id, permission_id=perm_id, access=access)
+                    for ur_id in ids_list for perm_id, access in accesses
+                ])
+    except IntegrityError:
+        # Looking for the rule which was broken,
+        # or raising the error as it is if none.
+        check_unique_rules(users_list, role, objs_dict)
+        check_existing_roles(users_list, role, objs_dict)
+        raise
+
+    # Cleaning the cache system.
+    delete_many_on_commit([(user, obj) for user in users_list for obj in objs_dict.values()], using)
+
+
+def build_user_roles(users_list, role, objs_dict):
+    """
+    Return the list of UserRole instances of the
+    role class for each user in "users_list" and
+    each object in "objs_dict", with the marks of
+    the unique constraints already filled.
+    """
+    ur_instances = list()
+    for user in users_list:
+        for key, obj in objs_dict.items():
+            ur_instances.append(UserRole(
+                role_class=role.get_class_name(),
+                user=user,
+                content_type_id=key[0] if key else None,
+                object_id=key[1] if key else None,
+                unique_role=True if role.unique is True and obj else None,
+                unique_object=True if obj and is_unique_together(obj) else None,
+            ))
+    return ur_instances
+
+
+def check_existing_roles(users_list, role, objs_dict):
+    """
+    Check if the role class is already attached
+    to any of the users and objects provided,
+    using one query per chunk.
+    """
+    query = UserRole.objects.filter(role_class=role.get_class_name())
+    for keys_chunk in chunks(list(objs_dict), CHUNK_SIZE):
+        for users_chunk in chunks(users_list, CHUNK_SIZE):
+            if query.filter(objects_condition(keys_chunk), user__in=users_chunk).exists():
+                raise InvalidRoleAssignment(
+                    'The role "%s" is already attached to some of '
+                    'the users and objects provided.' % role.get_verbose_name()
+                )
+
+
+def check_unique_rules(users_list, role, objs_dict):
+    """
+    Check the "unique" attribute of the role class
+    and the "unique_together" option of the models
+    against the existing UserRole instances, using
+    one query per rule.
+    """
+    name = role.get_verbose_name()
+
     # Check if the model accepts multiple roles
     # attached using the same User instance.
-    if obj and is_unique_together(obj):
-        for user in users_set:
-            has_user = get_roles(user=user, obj=obj)
-            if has_user:
+    unique_keys = [key for key, obj in objs_dict.items() if obj and is_unique_together(obj)]
+    for keys_chunk in chunks(unique_keys, CHUNK_SIZE):
+        for users_chunk in chunks(users_list, CHUNK_SIZE):
+            found = (UserRole.objects
+                     .filter(objects_condition(keys_chunk), user__in=users_chunk)
+                     .values_list('user', 'content_type', 'object_id')
+                     .first())
+            if found:
+                user = next(user for user in users_chunk if user.pk == found[0])
                 raise InvalidRoleAssignment(
                     'The user "%s" already has a role attached '
-                    'to the object "%s".' % (user, obj)
+                    'to the object "%s".' % (user, objs_dict[found[1:]])
                 )
 
+    # If the role is marked as unique but already has an user attached.
     if role.unique is True:
-        # If the role is marked as unique but multiple users are provided.
-        if len(users_list) > 1:
-            raise InvalidRoleAssignment(
-                'Multiple users were provided using "%s", '
-                'but it is marked as unique.' % name
-            )
-
-        # If the role is marked as unique but already has an user attached.
-        has_user = get_users(role_class=role, obj=obj)
-        if has_user:
-            raise InvalidRoleAssignment(
-                'The object "%s" already has a "%s" attached '
-                'and it is marked as unique.' % (obj, name)
-            )
-
-    for user in users_set:
-        ur_instance = UserRole(role_class=role.get_class_name(), user=user)
-        if obj:
-            ur_instance.obj = obj
-        ur_instance.save()
-
-        # Cleaning the cache system.
-        delete_from_cache(user, obj)
+        for keys_chunk in chunks(list(objs_dict), CHUNK_SIZE):
+            found = (UserRole.objects
+                     .filter(objects_condition(keys_chunk), role_class=role.get_class_name())
+                     .values_list('content_type', 'object_id')
+                     .first())
+            if found:
+                raise InvalidRoleAssignment(
+                    'The object "%s" already has a "%s" attached '
+                    'and it is marked as unique.' % (objs_dict[found], name)
+                )
 
 
 def assign_permission(user, role_class, permission, access, obj=None):
@@ -91,7 +213,7 @@ def assign_permission(user, role_class, permission, access, obj=None):
     "inherit_allow/inherit_deny".
     """
     role = get_roleclass(role_class)
-    perm = string_to_permission(permission)
+    perm_id = get_permission_id(permission)
     query = UserRole.objects.filter(user=user, role_class=role.get_class_name())
     if obj:
         ct_obj = ContentType.objects.get_for_model(obj)
@@ -103,7 +225,7 @@ def assign_permission(user, role_class, permission, access, obj=None):
     for role_obj in query:
         perm_obj, created = RolePermission.objects.get_or_create(  # pylint: disable=W0612
             role=role_obj,
-            permission=perm
+            permission_id=perm_id
         )
         perm_obj.access = bool(access)
         perm_obj.save()
@@ -145,12 +267,7 @@ def remove_roles(users_list, role_class=None, obj=None):
     # to the role class.
     check_my_model(role, obj)
 
-    # Cleaning the cache system.
-    for user in users_list:
-        delete_from_cache(user, obj)
-
-    # Cleaning the database.
-    query.delete()
+    delete_roles(query)
 
 
 def remove_all(role_class=None, obj=None):
@@ -182,9 +299,23 @@ def remove_all(role_class=None, obj=None):
     # to the role class.
     check_my_model(role, obj)
 
-    # Cleaning the cache system.
-    for role_obj in query:
-        delete_from_cache(role_obj.user, role_obj.obj)
+    delete_roles(query)
 
-        # Cleaning the database.
-        role_obj.delete()
+
+def delete_roles(query):
+    """
+    Delete all UserRole instances in "query" and
+    clean the cache about their users and objects,
+    using a fixed number of queries regardless of
+    the number of instances.
+    """
+    with transaction.atomic(using=query.db):
+        rows = list(query.values_list('user', 'content_type', 'object_id').distinct())
+        query.delete()
+
+    # Cleaning the cache system.
+    user_ct = ContentType.objects.get_for_model(get_user_model())
+    delete_many_on_commit([
+        ((user_ct.id, user_id), (ct_id, obj_id) if ct_id else None)
+        for user_id, ct_id, obj_id in rows
+    ], query.db)
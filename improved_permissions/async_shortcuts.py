@@ -0,0 +1,142 @@
+""" permissions async shortcuts """
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from improved_permissions import shortcuts
+
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:  # pragma: no cover
+    sync_to_async = None
+
+# Without asgiref, all calls run in a single thread,
+# as the "thread_sensitive" mode of asgiref does. So
+# the ORM keeps using the same database connection.
+EXECUTOR = ThreadPoolExecutor(max_workers=1)
+
+
+def to_async(func):
+    """
+    Transform the synchronous function "func"
+    into a coroutine function which runs it
+    outside of the event loop.
+    """
+    if sync_to_async is not None:
+        return sync_to_async(func)
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(EXECUTOR, partial(func, *args, **kwargs))
+    return wrapper
+
+
+async def aget_user(role_class=None, obj=None):
+    return await to_async(shortcuts.get_user)(role_class, obj)
+
+
+async def aget_users(role_class=None, obj=None):
+    # The QuerySet is evaluated outside of
+    # the event loop as well.
+    def get_users():
+        return list(shortcuts.get_users(role_class, obj))
+    return await to_async(get_users)()
+
+
+async def aget_user_ids(role_class=None, obj=None):
+    def get_user_ids():
+        return list(shortcuts.get_user_ids(role_class, obj))
+    return await to_async(get_user_ids)()
+
+
+async def aget_users_page(role_class=None, obj=None, cursor=None, limit=100):
+    return await to_async(shortcuts.get_users_page)(role_class, obj, cursor, limit)
+
+
+async def aget_objects(user, role_class=None, model=None):
+    return await to_async(shortcuts.get_objects)(user, role_class, model)
+
+
+async def aget_objects_page(user, role_class=None, model=None, cursor=None, limit=100):
+    return await to_async(shortcuts.get_objects_page)(user, role_class, model, cursor, limit)
+
+
+async def aget_role(user, obj=None):
+    return await to_async(shortcuts.get_role)(user, obj)
+
+
+async def aget_roles(user, obj=None):
+    return await to_async(shortcuts.get_roles)(user, obj)
+
+
+async def aget_roles_page(user, obj=None, cursor=None, limit=100):
+    return await to_async(shortcuts.get_roles_page)(user, obj, cursor, limit)
+
+
+async def ahas_role(user, role_class=None, obj=None):
+    return await to_async(shortcuts.has_role)(user, role_class, obj)
+
+
+async def ahas_roles(user, role_class, objs_list):
+    return await to_async(shortcuts.has_roles)(user, role_class, objs_list)
+
+
+async def ahas_permission(user, permission, obj=None, any_object=False, persistent=None):
+    return await to_async(shortcuts.has_permission)(user, permission, obj, any_object, persistent)
+
+
+async def ahas_permissions(user, permission, objs_list, persistent=None):
+    return await to_async(shortcuts.has_permissions)(user, permission, objs_list, persistent)
+
+
+async def ahas_permission_many(user, permission, objs_list, persistent=None):
+    """
+    Check the permission for each object of
+    "objs_list" using "has_permissions" once
+    per model. Return the list of results in
+    the same order.
+    """
+    def has_permission_many():
+        grouped = dict()
+        for obj in objs_list:
+            grouped.setdefault(obj.__class__, []).append(obj)
+
+        result = dict()
+        for model, model_objs in grouped.items():
+            checks = shortcuts.has_permissions(user, permission, model_objs, persistent)
+            result.update(((model, pk), value) for pk, value in checks.items())
+        return [result[(obj.__class__, obj.pk)] for obj in objs_list]
+    return await to_async(has_permission_many)()
+
+
+async def afilter_queryset(user, permission, queryset, persistent=None):
+    return await to_async(shortcuts.filter_queryset)(user, permission, queryset, persistent)
+
+
+async def aassign_role(user, role_class, obj=None):
+    await to_async(shortcuts.assign_role)(user, role_class, obj)
+
+
+async def aassign_roles(users_list, role_class, obj=None):
+    await to_async(shortcuts.assign_roles)(users_list, role_class, obj)
+
+
+async def abulk_assign_roles(users_list, role_class, objs_list):
+    await to_async(shortcuts.bulk_assign_roles)(users_list, role_class, objs_list)
+
+
+async def aremove_role(user, role_class=None, obj=None):
+    await to_async(shortcuts.remove_role)(user, role_class, obj)
+
+
+async def aremove_roles(users_list, role_class=None, obj=None):
+    await to_async(shortcuts.remove_roles)(users_list, role_class, obj)
+
+
+async def aremove_all(role_class=None, obj=None):
+    await to_async(shortcuts.remove_all)(role_class, obj)
+
+
+async def aassign_permission(user, role_class, permission, access, obj=None):
+    await to_async(shortcuts.assign_permission)(user, role_class, permission, access, obj)
@@ -0,0 +1,180 @@
+""" permissions local cache """
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+
+# All LocalCache instances of
+# the current process.
+LOCAL_CACHES = dict()
+LOCAL_CACHES_LOCK = threading.Lock()
+
+# Size of the LRU, lifetime of the entries and
+# seconds between the version stamp checks.
+LocalOptions = namedtuple('LocalOptions', ['max_entries', 'timeout', 'interval'])
+
+
+class LocalCache(object):
+    """
+    LocalCache
+
+    In-process LRU cache placed in front of
+    the Django cache used by the DIP. Every
+    entry expires after "timeout" seconds.
+
+    All changes made through any process bump a
+    version stamp stored in the shared cache. The
+    stamp is checked at most every "interval"
+    seconds, erasing the local entries when it
+    changes. So other processes see the changes
+    after "interval" seconds at most.
+    """
+
+    def __init__(self, alias, prefix, options):
+        self.alias = alias
+        self.version_key = '{}-local-version'.format(prefix)
+        self.options = options
+
+        self.lock = threading.RLock()
+        self.entries = OrderedDict()
+        self.version = None
+        self.checked_at = None
+
+    @classmethod
+    def get_instance(cls, alias, prefix, options):
+        """
+        Return the LocalCache instance of
+        the process for these settings.
+        """
+        key = (alias, prefix, options)
+        with LOCAL_CACHES_LOCK:
+            if key not in LOCAL_CACHES:
+                LOCAL_CACHES[key] = cls(alias, prefix, options)
+            return LOCAL_CACHES[key]
+
+    @property
+    def shared(self):
+        """
+        The Django cache shared by
+        all processes.
+        """
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def __getattr__(self, name):
+        # Any other method goes
+        # straight to the shared cache.
+        return getattr(self.shared, name)
+
+    def check_version(self):
+        """
+        Erase all local entries if the version
+        stamp in the shared cache has changed.
+        """
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < self.options.interval:
+            return
+
+        version = self.shared.get(self.version_key)
+        if version is None:
+            # The shared cache was cleared.
+            self.shared.add(self.version_key, uuid.uuid4().hex, None)
+            version = self.shared.get(self.version_key)
+
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+            self.checked_at = now
+
+    def bump_version(self):
+        """
+        Erase all local entries and notify
+        the other processes to do the same.
+        """
+        version = uuid.uuid4().hex
+        self.shared.set(self.version_key, version, None)
+        with self.lock:
+            self.entries.clear()
+            self.version = version
+            self.checked_at = time.monotonic()
+
+    def get_local(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set_local(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.options.timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.options.max_entries:
+                self.entries.popitem(last=False)
+
+    def get(self, key, default=None, version=None):
+        self.check_version()
+        entry = self.get_local(key)
+        if entry is not None:
+            return entry[0]
+
+        value = self.shared.get(key, version=version)
+        if value is None:
+            return default
+        self.set_local(key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        self.check_version()
+        result = dict()
+        missing = list()
+        for key in keys:
+            entry = self.get_local(key)
+            if entry is not None:
+                result[key] = entry[0]
+            else:
+                missing.append(key)
+
+        if missing:
+            found = self.shared.get_many(missing, version=version)
+            for key, value in found.items():
+                self.set_local(key, value)
+            result.update(found)
+        return result
+
+    def set(self, key, value, *args, **kwargs):
+        self.shared.set(key, value, *args, **kwargs)
+        self.set_local(key, value)
+
+    def set_many(self, data, *args, **kwargs):
+        result = self.shared.set_many(data, *args, **kwargs)
+        for key, value in data.items():
+            self.set_local(key, value)
+        return result
+
+    def add(self, key, value, *args, **kwargs):
+        # Missing keys are never stored locally,
+        # so there is nothing to erase.
+        return self.shared.add(key, value, *args, **kwargs)
+
+    def incr(self, key, delta=1, version=None):
+        result = self.shared.incr(key, delta, version=version)
+        self.bump_version()
+        return result
+
+    def delete(self, key, version=None):
+        self.shared.delete(key, version=version)
+        self.bump_version()
+
+    def delete_many(self, keys, version=None):
+        self.shared.delete_many(keys, version=version)
+        self.bump_version()
+
+    def clear(self):
+        self.shared.clear()
+        self.bump_version()
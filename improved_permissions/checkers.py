@@ -1,12 +1,21 @@
 """checkers functions"""
+from itertools import chain
+
 from django.contrib.contenttypes.models import ContentType
+from django.db.models import (BooleanField, Case, F, IntegerField, OuterRef,
+                              Q, Subquery, Value, When)
+from django.db.models.functions import Coalesce
 
 from improved_permissions.exceptions import NotAllowed
-from improved_permissions.models import UserRole
-from improved_permissions.utils import (check_my_model, get_config,
-                                        get_from_cache, get_parents,
-                                        get_roleclass, inherit_check,
-                                        string_to_permission)
+from improved_permissions.models import RolePermission, UserRole
+from improved_permissions.roles import RoleManager
+from improved_permissions.utils import (check_my_model, default_check,
+                                        get_ancestors, get_config,
+                                        get_from_cache, get_generations,
+                                        get_many_ancestors,
+                                        get_many_from_cache, get_object_key,
+                                        get_parents_paths, get_permission_id,
+                                        get_roleclass, get_roles_from_cache)
 
 
 def has_role(user, role_class=None, obj=None):
@@ -20,32 +29,52 @@ def has_role(user, role_class=None, obj=None):
     If "obj" is provided, the search is
     refined to look only at that object.
     """
-
-    query = UserRole.objects.filter(user=user)
     role = None
-
     if role_class:
-        # Filtering by role class.
         role = get_roleclass(role_class)
-        query = query.filter(role_class=role.get_class_name(), user=user)
-
-    if obj:
-        # Filtering by object.
-        ct_obj = ContentType.objects.get_for_model(obj)
-        query.filter(content_type=ct_obj.id, object_id=obj.id)
 
     # Check if object belongs
     # to the role class.
     check_my_model(role, obj)
 
-    return query.count() > 0
+    obj_key = get_object_key(obj) if obj else None
+    names = get_roles_from_cache(user, [obj_key])[obj_key]
+    if role:
+        return role.get_class_name() in names
+    return bool(names)
+
+
+def has_roles(user, role_class, objs_list):
+    """
+    Same as "has_role", but for a list of
+    objects at once. Return a dictionary mapping
+    the primary key of each object to the result.
+
+    All objects are checked using a single
+    query and a single cache call.
+    """
+    role = None
+    if role_class:
+        role = get_roleclass(role_class)
+
+    objs_list = list(objs_list)
+    for obj in objs_list:
+        check_my_model(role, obj)
+
+    names = get_roles_from_cache(user, [get_object_key(obj) for obj in objs_list])
+
+    result = dict()
+    for obj in objs_list:
+        obj_names = names[get_object_key(obj)]
+        result[obj.pk] = role.get_class_name() in obj_names if role else bool(obj_names)
+    return result
 
 
 def has_permission(user, permission, obj=None, any_object=False, persistent=None):
     """
     Return True if the "user" has the "permission".
     """
-    perm_obj = string_to_permission(permission)
+    perm_id = get_permission_id(permission)
 
     # Checking the 'any_object' bypass kwarg.
     if any_object and obj:
@@ -57,45 +86,196 @@ def has_permission(user, permission, obj=None, any_object=False, persistent=None
     if not isinstance(persistent, bool):
         persistent = get_config('PERSISTENT', False)
 
-    stack = list()
-    stack.append(obj)
-    while stack:
+    # Fetching the generations of the user and
+    # the object, the only ones always needed.
+    obj_key = get_object_key(obj) if obj else None
+    generations = get_generations([user] + ([obj_key] if obj else []))
+
+    def lookup(current_obj):
+        return get_from_cache(user, current_obj, any_object, generations)
+
+    def walk():
+        # Walking through the object, all of its parents
+        # and, at last, the ALL_MODELS roles using 'None'.
+        if obj:
+            yield obj_key
+
+            # The parents are only resolved if the
+            # object itself does not decide, and their
+            # generations are fetched at once.
+            ancestors = list(get_ancestors(obj))
+            if ancestors:
+                generations.update(get_generations(ancestors))
+            yield from ancestors
+        yield None
+
+    nodes = walk()
+    return resolve_permission(perm_id, permission, nodes, persistent, lookup)
+
+
+def has_permissions(user, permission, objs_list, persistent=None):
+    """
+    Same as "has_permission", but for a list of
+    objects at once. Return a dictionary mapping
+    the primary key of each object to the result.
+
+    All objects and their parents are loaded using
+    a fixed number of queries and cache calls.
+    """
+    perm_id = get_permission_id(permission)
+
+    # Checking the 'persistent' bypass kwarg.
+    if not isinstance(persistent, bool):
+        persistent = get_config('PERSISTENT', False)
+
+    objs_list = list(objs_list)
+    if not objs_list:
+        return dict()
+
+    # Loading all objects and parents
+    # and their data at once.
+    ancestors = get_many_ancestors(objs_list)
+    keys_set = set(ancestors)
+    for keys_list in ancestors.values():
+        keys_set.update(keys_list)
+
+    data = get_many_from_cache(user, keys_set)
+    data[None] = get_from_cache(user, None, any_object=False)
+
+    result = dict()
+    for obj in objs_list:
+        obj_key = get_object_key(obj)
+        nodes = chain([obj_key], ancestors[obj_key], [None])
+        result[obj.pk] = resolve_permission(perm_id, permission, nodes, persistent, data.get)
+    return result
+
+
+def resolve_permission(perm_id, permission, nodes, persistent, lookup):
+    """
+    Walk through the "nodes" looking for the
+    permission. The function "lookup" returns
+    the cached data of the user about each of
+    them. Repeated nodes are visited only once.
+    """
+    visited = set()
+    for current_obj in nodes:
+        if current_obj in visited:
+            continue
+        visited.add(current_obj)
+
         # Getting the permissions list of the first
         # role class based on their role ranking.
-        current_obj = stack.pop(0)
-        result_tuple = get_from_cache(user, current_obj, any_object)
+        result_tuple = lookup(current_obj)
 
         if result_tuple:
             # Checking now for database results.
             result = None
             for perm_tuple in result_tuple[1]:
-                if perm_tuple[0] == perm_obj.id:
+                if perm_tuple[0] == perm_id:
                     result = perm_tuple[1]
                     break
 
-            # If nothing was found, check for inherit results.
+            # If nothing was found, check for default results.
             if result is None:
-                result = inherit_check(result_tuple[0], permission)
+                result = default_check(result_tuple[0], perm_id, permission)
 
             # We got a result.
             # Now checking for persistent mode.
             if result or not persistent:
                 return result
 
-        # Try to look even further
-        # for possible parent fields.
-        parents_list = get_parents(current_obj)
-        for parent in parents_list:
-            stack.append(parent)
-
-        # Force another iteration in case of any permission was
-        # found using object-related roles. Using 'None', we
-        # check now for ALL_MODELS roles.
-        if obj and not stack:
-            stack.append(None)
-            obj = None
-
     # If all fails and the user does not have
     # a role class with "ALL_MODELS", we finally
     # deny the permission.
     return False
+
+
+def filter_queryset(user, permission, queryset, persistent=None):
+    """
+    Return the "queryset" filtered to only the objects
+    which the "user" has the "permission", following
+    the same rules of has_permission.
+
+    All the work is done by the database using
+    subqueries, so no object is loaded in memory.
+    """
+    perm_id = get_permission_id(permission)
+
+    # Checking the 'persistent' bypass kwarg.
+    if not isinstance(persistent, bool):
+        persistent = get_config('PERSISTENT', False)
+
+    # Building the expressions of the object, all
+    # of its parents and, at last, the one for
+    # ALL_MODELS roles.
+    annotations = dict()
+    nodes = list()
+    max_depth = get_config('MAX_PARENTS_DEPTH', None)
+    for index, (path, model) in enumerate(get_parents_paths(queryset.model, max_depth)):
+        ref = 'pk'
+        if path:
+            ref = '_dip_parent_%d' % index
+            annotations[ref] = F(path)
+        ct_obj = ContentType.objects.get_for_model(model)
+        query = UserRole.objects.filter(content_type=ct_obj.id, object_id=OuterRef(ref))
+        nodes.append(role_access_subquery(user, perm_id, permission, query))
+
+    query = UserRole.objects.filter(content_type__isnull=True, object_id__isnull=True)
+    nodes.append(role_access_subquery(user, perm_id, permission, query))
+
+    queryset = queryset.annotate(**annotations)
+    if persistent:
+        # Any object in the chain allowing
+        # the permission is enough.
+        condition = Q()
+        for index, node in enumerate(nodes):
+            name = '_dip_access_%d' % index
+            queryset = queryset.annotate(**{name: node})
+            condition |= Q(**{name: True})
+        return queryset.filter(condition)
+
+    # Only the first object in the chain
+    # having a role attached decides.
+    expression = Coalesce(*nodes, output_field=BooleanField())
+    return queryset.annotate(_dip_access=expression).filter(_dip_access=True)
+
+
+def role_access_subquery(user, perm_id, permission, query):
+    """
+    Return a subquery with the access value of the
+    "permission" from the first role class of the
+    "user" in "query" based on their role ranking.
+    """
+    roles_list = RoleManager.get_roles()
+    names = [role.get_class_name() for role in roles_list]
+
+    # Ranking of each role class.
+    rankings = dict()
+    for role in roles_list:
+        rankings.setdefault(role.ranking, []).append(role.get_class_name())
+    ranking = Case(
+        *[When(role_class__in=value, then=Value(key)) for key, value in rankings.items()],
+        default=Value(0), output_field=IntegerField()
+    )
+
+    # Value used when the role instance does not
+    # have the permission stored in the database.
+    inherit_list = [role.get_class_name() for role in roles_list
+                    if default_check(role, perm_id, permission)]
+    inherit = Case(
+        When(role_class__in=inherit_list, then=Value(True)),
+        default=Value(False), output_field=BooleanField()
+    )
+
+    stored = (RolePermission.objects
+              .filter(role=OuterRef('pk'), permission=perm_id)
+              .values('access')[:1])
+
+    query = (query
+             .filter(user=user, role_class__in=names)
+             .annotate(_dip_ranking=ranking)
+             .annotate(_dip_access=Coalesce(Subquery(stored, output_field=BooleanField()), inherit))
+             .order_by('_dip_ranking', 'pk')
+             .values('_dip_access')[:1])
+
+    return Subquery(query, output_field=BooleanField())
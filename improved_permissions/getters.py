@@ -1,9 +1,12 @@
 """getters functions"""
+from collections import OrderedDict
+
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
 
 from improved_permissions.exceptions import NotAllowed
 from improved_permissions.models import UserRole
+from improved_permissions.roles import RoleManager
 from improved_permissions.utils import check_my_model, get_roleclass
 
 
@@ -16,39 +19,39 @@ def get_user(role_class=None, obj=None):
     Returns None if there is no user attached
     to the object.
     """
-    query = UserRole.objects.select_related('user').all()
+    # Looking for a role class using unique=True
+    names = RoleManager.get_unique_names()
     role = None
 
     if role_class:
         # All users who have "role_class" attached to any object.
         role = get_roleclass(role_class)
-        query = query.filter(role_class=role.get_class_name())
+        names = names & {role.get_class_name()}
 
+    # Check if object belongs
+    # to the role class.
+    check_my_model(role, obj)
+
+    if not names:
+        return None
+
+    query = UserRole.objects.filter(role_class__in=names)
     if obj:
         # All users who have any role attached to the object.
         ct_obj = ContentType.objects.get_for_model(obj)
         query = query.filter(content_type=ct_obj.id, object_id=obj.id)
 
-    # Check if object belongs
-    # to the role class.
-    check_my_model(role, obj)
-
-    # Looking for a role class using unique=True
-    selected = list()
-    for ur_obj in query:
-        role = get_roleclass(ur_obj.role_class)
-        if role.unique is True:
-            selected.append(ur_obj.user)
-
-    users_set = set(selected)
-    if len(users_set) > 1:
+    # Two users are enough to
+    # know that there are many.
+    users_list = list(get_user_model().objects.filter(pk__in=query.values('user'))[:2])
+    if len(users_list) > 1:
         raise NotAllowed(
             'Multiple unique roles was found using '
             'the function get_user.  Use get_users '
             'instead.'
         )
-    if len(users_set) == 1:
-        return selected[0]
+    if users_list:
+        return users_list[0]
     return None
 
 
@@ -66,26 +69,56 @@ def get_users(role_class=None, obj=None):
     If neither "role_class" or "obj" are provided,
     returns all users of the project.
     """
+    query = get_users_roles(role_class, obj)
+    if query is None:
+        return get_user_model().objects.all()
+
+    # A semi-join against the role instances,
+    # so each user is found once without the
+    # need of DISTINCT.
+    return get_user_model().objects.filter(pk__in=query.values('user'))
+
+
+def get_user_ids(role_class=None, obj=None):
+    """
+    Return a QuerySet of the primary keys of the
+    users of "get_users", read from the role
+    instances only.
+    """
+    query = get_users_roles(role_class, obj)
+    if query is None:
+        return get_user_model().objects.values_list('pk', flat=True)
+    return query.values_list('user', flat=True).order_by('user').distinct()
+
+
+def get_users_roles(role_class=None, obj=None):
+    """
+    Return the QuerySet of the UserRole instances
+    used by "get_users", or None if there is
+    no filter at all.
+    """
     role = None
     kwargs = {}
 
     if role_class:
         # All users who have "role_class" attached to any object.
         role = get_roleclass(role_class)
-        kwargs['roles__role_class'] = role.get_class_name()
+        kwargs['role_class'] = role.get_class_name()
 
     if obj:
         # All users who have any role attached to the object.
         ct_obj = ContentType.objects.get_for_model(obj)
-        kwargs['roles__content_type'] = ct_obj.id
-        kwargs['roles__object_id'] = obj.id
+        kwargs['content_type'] = ct_obj.id
+        kwargs['object_id'] = obj.id
 
     # Check if object belongs
     # to the role class.
     check_my_model(role, obj)
 
-    # Return as a distinct QuerySet.
-    return get_user_model().objects.filter(**kwargs).distinct()
+    if not kwargs:
+        return None
+    return UserRole.objects.filter(**kwargs)
+
 
 def get_objects(user, role_class=None, model=None):
     """
@@ -99,7 +132,41 @@ def get_objects(user, role_class=None, model=None):
     If "model" is provided, only the objects
     of that model will be returned.
     """
-    query = UserRole.objects.filter(user=user)
+    return list(iter_objects(user, role_class, model))
+
+
+def get_objects_querysets(user, role_class=None, model=None):
+    """
+    Return a dict with a lazy QuerySet of the
+    objects attached to the user for each model,
+    using the same filters of "get_objects".
+
+    The ids of the objects are never loaded,
+    each QuerySet uses a subquery instead.
+    """
+    query = get_objects_roles(user, role_class, model)
+    cts_list = (query.values_list('content_type', flat=True)
+                .order_by('content_type')
+                .distinct())
+
+    result = OrderedDict()
+    for ct_id in cts_list:
+        ct_model = ContentType.objects.get_for_id(ct_id).model_class()
+        if ct_model is None:
+            # The model was removed from the project.
+            continue
+        subquery = query.filter(content_type=ct_id).values('object_id')
+        result[ct_model] = ct_model._base_manager.filter(pk__in=subquery)
+    return result
+
+
+def get_objects_roles(user, role_class=None, model=None):
+    """
+    Return the QuerySet of the UserRole instances
+    attached to the user and to some object, using
+    the same filters of "get_objects".
+    """
+    query = UserRole.objects.filter(user=user, content_type__isnull=False)
     role = None
 
     if role_class:
@@ -115,11 +182,19 @@ def get_objects(user, role_class=None, model=None):
     # Check if object belongs
     # to the role class.
     check_my_model(role, model)
+    return query
+
 
-    # TODO
-    result = set(ur_obj.obj for ur_obj in query)
-    # TODO
-    return list(result)
+def iter_objects(user, role_class=None, model=None, chunk_size=2000):
+    """
+    Iterate over the objects attached to the
+    user, using the same filters of "get_objects".
+    The objects are fetched in chunks, one model
+    at a time.
+    """
+    querysets = get_objects_querysets(user, role_class, model)
+    for queryset in querysets.values():
+        yield from queryset.iterator(chunk_size=chunk_size)
 
 
 def get_role(user, obj=None):
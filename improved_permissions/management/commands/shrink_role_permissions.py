@@ -0,0 +1,68 @@
+""" shrink_role_permissions command """
+from django.core.management.base import BaseCommand, CommandError
+
+from improved_permissions.exceptions import RoleNotFound
+from improved_permissions.models import RolePermission
+from improved_permissions.roles import RoleManager
+from improved_permissions.utils import get_config
+
+
+class Command(BaseCommand):
+    """
+    Delete all RolePermission instances which
+    store the same access derived from the role
+    class, keeping only the ones changed by
+    "assign_permission". Requires the "SPARSE"
+    setting, so the results of the permission
+    checks stay the same.
+    """
+    help = 'Delete the RolePermission rows which are not needed using sparse storage.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows deleted by each query.'
+        )
+
+    def handle(self, *args, **options):
+        from django.contrib.auth.models import Permission
+
+        if not get_config('SPARSE', False):
+            raise CommandError(
+                'Enable the "SPARSE" setting before removing the '
+                'default permissions, otherwise they are lost.'
+            )
+
+        perms = Permission.objects.values_list('id', 'content_type__app_label', 'codename')
+        perms_dict = {item[0]: '%s.%s' % (item[1], item[2]) for item in perms}
+
+        total = self.delete_defaults(perms_dict, options['batch_size'])
+        self.stdout.write('%d RolePermission rows deleted.' % total)
+
+    def delete_defaults(self, perms_dict, batch_size):
+        """
+        Delete the RolePermission rows holding the
+        default access of their role class, running
+        one query for every "batch_size" rows found.
+        """
+        query = (RolePermission.objects
+                 .values_list('id', 'role__role_class', 'permission', 'access')
+                 .order_by('id'))
+
+        ids_list = list()
+        total = 0
+        for rp_id, role_class, perm_id, access in query.iterator():
+            try:
+                policy = RoleManager.get_policy(role_class)
+            except RoleNotFound:
+                continue
+
+            if policy.default_check(perm_id, perms_dict[perm_id]) == access:
+                ids_list.append(rp_id)
+            if len(ids_list) >= batch_size:
+                total += RolePermission.objects.filter(id__in=ids_list).delete()[0]
+                ids_list = list()
+
+        if ids_list:
+            total += RolePermission.objects.filter(id__in=ids_list).delete()[0]
+        return total
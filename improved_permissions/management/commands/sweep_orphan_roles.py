@@ -0,0 +1,91 @@
+""" sweep_orphan_roles command """
+from django.core.management.base import BaseCommand
+from django.db.models import AutoField, BigAutoField, Exists, IntegerField, OuterRef
+
+from improved_permissions.assignments import delete_roles
+from improved_permissions.models import UserRole
+
+
+class Command(BaseCommand):
+    """
+    Delete all UserRole instances whose object
+    no longer exists, like the ones left behind
+    by deletions which skip the signals, such as
+    "QuerySet.update" or raw SQL.
+    """
+    help = 'Delete the UserRole rows whose object no longer exists.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of rows deleted by each query.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true', dest='dry_run',
+            help='Only count the orphan rows.'
+        )
+
+    def get_orphans(self, ct_id):
+        """
+        Return the QuerySet of the orphan
+        UserRole instances for the content
+        type "ct_id", or None if the object
+        ids cannot be compared in the database.
+        """
+        from django.contrib.contenttypes.models import ContentType
+
+        query = UserRole.objects.filter(content_type_id=ct_id)
+        model = ContentType.objects.get_for_id(ct_id).model_class()
+        if model is None:
+            # The model was removed from the project.
+            return query
+
+        # The "object_id" is a positive integer, so
+        # only integer primary keys are comparable.
+        # Primary keys which are relations, like the
+        # ones of multi-table inheritance, use the
+        # type of their target.
+        pk_field = model._meta.pk
+        while pk_field.is_relation:
+            pk_field = pk_field.target_field
+        if not isinstance(pk_field, (AutoField, BigAutoField, IntegerField)):
+            return None
+
+        # Anti-join against the table of the model.
+        subquery = model._base_manager.filter(pk=OuterRef('object_id'))
+        return query.annotate(_dip_exists=Exists(subquery)).filter(_dip_exists=False)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        dry_run = options['dry_run']
+
+        cts_list = (UserRole.objects
+                    .filter(content_type__isnull=False)
+                    .values_list('content_type', flat=True)
+                    .order_by('content_type')
+                    .distinct())
+
+        total = 0
+        for ct_id in list(cts_list):
+            query = self.get_orphans(ct_id)
+            if query is None:
+                continue
+
+            # Keyset pagination, so each chunk
+            # starts from an index lookup.
+            last_id = 0
+            while True:
+                ids_list = list(query.filter(id__gt=last_id)
+                                .values_list('id', flat=True)
+                                .order_by('id')[:chunk_size])
+                if not ids_list:
+                    break
+                last_id = ids_list[-1]
+                total += len(ids_list)
+                if not dry_run:
+                    delete_roles(UserRole.objects.filter(id__in=ids_list))
+
+        if dry_run:
+            self.stdout.write('%d orphan UserRole rows found.' % total)
+        else:
+            self.stdout.write('%d orphan UserRole rows deleted.' % total)
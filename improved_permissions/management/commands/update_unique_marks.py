@@ -0,0 +1,65 @@
+""" update_unique_marks command """
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from improved_permissions.models import UserRole
+from improved_permissions.roles import RoleManager
+from improved_permissions.utils import is_unique_together
+
+
+class Command(BaseCommand):
+    """
+    Recompute the marks used by the unique
+    constraints of all UserRole instances,
+    based on the "unique" attribute of the
+    registered Role classes and on the
+    "unique_together" of the models.
+
+    The marks are written when the roles are
+    assigned, so this command must run after
+    upgrading to the marks and whenever one
+    of these options changes.
+    """
+    help = 'Recompute the marks used by the unique constraints of the roles.'
+
+    def handle(self, *args, **options):
+        from django.contrib.contenttypes.models import ContentType
+
+        names = list(RoleManager.get_unique_names())
+        total = 0
+        try:
+            with transaction.atomic(using=UserRole.objects.db):
+                # Dropping the stale marks first, so
+                # they never block the new ones.
+                total += (UserRole.objects
+                          .exclude(role_class__in=names, content_type__isnull=False)
+                          .filter(unique_role=True)
+                          .update(unique_role=None))
+                total += (UserRole.objects
+                          .filter(role_class__in=names, content_type__isnull=False)
+                          .exclude(unique_role=True)
+                          .update(unique_role=True))
+
+                cts_list = (UserRole.objects
+                            .filter(content_type__isnull=False)
+                            .values_list('content_type', flat=True)
+                            .order_by('content_type')
+                            .distinct())
+                for ct_id in list(cts_list):
+                    model = ContentType.objects.get_for_id(ct_id).model_class()
+                    query = UserRole.objects.filter(content_type=ct_id)
+                    if model is not None and is_unique_together(model):
+                        total += query.exclude(unique_object=True).update(unique_object=True)
+                    else:
+                        total += query.filter(unique_object=True).update(unique_object=None)
+
+                total += (UserRole.objects
+                          .filter(content_type__isnull=True, unique_object=True)
+                          .update(unique_object=None))
+        except IntegrityError as error:
+            raise CommandError(
+                'The existing roles break the unique rules. Remove the '
+                'duplicated roles and run it again: %s' % error
+            )
+
+        self.stdout.write('%d UserRole rows updated.' % total)
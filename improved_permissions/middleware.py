@@ -0,0 +1,19 @@
+""" permissions middleware """
+from improved_permissions.utils import permission_memo
+
+
+class PermissionMemoMiddleware(object):
+    """
+    PermissionMemoMiddleware
+
+    This middleware enables the memo layer
+    during each request, so repeated permission
+    checks cost a single dictionary lookup.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with permission_memo():
+            return self.get_response(request)
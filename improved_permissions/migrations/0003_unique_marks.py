@@ -0,0 +1,32 @@
+# Generated by Django 2.0.13 on 2026-10-18 01:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('improved_permissions', '0002_auto_20180227_2108'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userrole',
+            name='unique_object',
+            field=models.NullBooleanField(editable=False),
+        ),
+        migrations.AddField(
+            model_name='userrole',
+            name='unique_role',
+            field=models.NullBooleanField(editable=False),
+        ),
+        # The marks of the existing roles are filled
+        # by the command "update_unique_marks".
+        migrations.AlterUniqueTogether(
+            name='userrole',
+            unique_together={('user', 'role_class', 'content_type', 'object_id'), ('user', 'content_type', 'object_id', 'unique_object'), ('content_type', 'object_id', 'role_class', 'unique_role')},
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.0.13 on 2026-10-18 01:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('improved_permissions', '0003_unique_marks'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userrole',
+            name='content_type',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType'),
+        ),
+        migrations.AlterField(
+            model_name='userrole',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='roles', to=settings.AUTH_USER_MODEL, verbose_name='Usuário'),
+        ),
+        migrations.AddIndex(
+            model_name='userrole',
+            index=models.Index(fields=['role_class', 'user'], name='dip_userrole_role_user_idx'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 """ permissions mixins """
+import inspect
+
 from django.contrib.contenttypes.fields import GenericRelation
 from django.core.exceptions import ImproperlyConfigured, PermissionDenied
 from django.db import models
@@ -22,6 +24,9 @@ class UserRoleMixin(models.Model):
     def has_role(self, role_class=None, obj=None):
         return shortcuts.has_role(self, role_class, obj)
 
+    def has_roles(self, role_class, objs_list):
+        return shortcuts.has_roles(self, role_class, objs_list)
+
     def get_role(self, obj=None):
         return shortcuts.get_role(self, obj)
 
@@ -40,6 +45,12 @@ class UserRoleMixin(models.Model):
     def has_permission(self, permission, obj=None, any_object=False, persistent=None):
         return shortcuts.has_permission(self, permission, obj, any_object, persistent)
 
+    def has_permissions(self, permission, objs_list, persistent=None):
+        return shortcuts.has_permissions(self, permission, objs_list, persistent)
+
+    def filter_queryset(self, permission, queryset, persistent=None):
+        return shortcuts.filter_queryset(self, permission, queryset, persistent)
+
 
 class RoleMixin(models.Model):
     """
@@ -65,6 +76,9 @@ class RoleMixin(models.Model):
     def get_users(self, role_class=None):
         return shortcuts.get_users(role_class, self)
 
+    def get_user_ids(self, role_class=None):
+        return shortcuts.get_user_ids(role_class, self)
+
     def has_role(self, user, role_class=None):
         return shortcuts.has_role(user, role_class, self)
 
@@ -90,12 +104,13 @@ class RoleMixin(models.Model):
         return shortcuts.remove_all(role_class, self)
 
 
-class PermissionMixin(object):
+class BasePermissionMixin(object):
     """
-    PermissionMixin
+    BasePermissionMixin
 
-    This mixin helps the class-based views
-    to secure them based in permissions.
+    Attributes and checks shared by the
+    permission mixins of the class-based
+    views, without the "dispatch".
     """
     permission_string = ""
     permission_any_object = False
@@ -136,7 +151,38 @@ class PermissionMixin(object):
             self.permission_persistent,
         )
 
+
+class PermissionMixin(BasePermissionMixin):
+    """
+    PermissionMixin
+
+    This mixin helps the class-based views
+    to secure them based in permissions.
+    """
+
     def dispatch(self, request, *args, **kwargs):
         if not self.check_permission():
             raise PermissionDenied
         return super().dispatch(request, *args, **kwargs)
+
+
+class AsyncPermissionMixin(BasePermissionMixin):
+    """
+    AsyncPermissionMixin
+
+    Same as PermissionMixin, but for async
+    class-based views. The permission check
+    runs outside of the event loop.
+    """
+
+    async def check_permission(self):
+        from improved_permissions.async_shortcuts import to_async
+        return await to_async(super().check_permission)()
+
+    async def dispatch(self, request, *args, **kwargs):
+        if not await self.check_permission():
+            raise PermissionDenied
+        response = super().dispatch(request, *args, **kwargs)
+        if inspect.isawaitable(response):
+            response = await response
+        return response
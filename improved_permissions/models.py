@@ -7,9 +7,9 @@ from django.core.exceptions import ValidationError
 from django.db import models
 
 from improved_permissions.exceptions import RoleNotFound
-from improved_permissions.roles import ALL_MODELS, ALLOW_MODE
-from improved_permissions.utils import (get_permissions_list, get_roleclass,
-                                        permission_to_string)
+from improved_permissions.roles import ALL_MODELS, RoleManager
+from improved_permissions.utils import (get_config, get_roleclass,
+                                        is_unique_together)
 
 
 class UserRole(models.Model):
@@ -21,11 +21,14 @@ class UserRole(models.Model):
     Django model, according to the rules defined
     in the Role class.
     """
+    # The unique constraints below already index
+    # the foreign keys as their first columns.
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         related_name='roles',
-        verbose_name='Usuário'
+        verbose_name='Usuário',
+        db_index=False
     )
 
     permissions = models.ManyToManyField(
@@ -37,14 +40,30 @@ class UserRole(models.Model):
 
     role_class = models.CharField(max_length=256)
 
-    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, db_index=False)
     object_id = models.PositiveIntegerField(null=True)
     obj = GenericForeignKey()
 
+    # Marks used by the unique constraints. They are
+    # True when the rule applies and None otherwise,
+    # since NULL values are never equal to each other.
+    unique_role = models.NullBooleanField(editable=False)
+    unique_object = models.NullBooleanField(editable=False)
+
     class Meta:
         verbose_name = 'Role Instance'
         verbose_name_plural = 'Role Instances'
-        unique_together = ('user', 'role_class', 'content_type', 'object_id')
+        unique_together = (
+            ('user', 'role_class', 'content_type', 'object_id'),
+            # Roles using unique=True.
+            ('content_type', 'object_id', 'role_class', 'unique_role'),
+            # Models using "unique_together" in RoleOptions.
+            ('user', 'content_type', 'object_id', 'unique_object'),
+        )
+        indexes = [
+            # Users of a role class on any object.
+            models.Index(fields=['role_class', 'user'], name='dip_userrole_role_user_idx'),
+        ]
 
     def __str__(self):
         role = get_roleclass(self.role_class)
@@ -70,34 +89,49 @@ class UserRole(models.Model):
 
     def save(self, *args, **kwargs):  # pylint: disable=arguments-differ,unused-argument
         self.clean()
+        self.set_unique_marks()
         super().save()
 
+        role_instances = list()
+        for perm_id, access in self.get_accesses(self.role_class):
+            role_instances.append(RolePermission(role=self, permission_id=perm_id, access=access))
+
+        RolePermission.objects.bulk_create(role_instances)
+
+    def set_unique_marks(self):
+        """
+        Fill the fields used by the unique
+        constraints based on the role class
+        and the model of the object.
+        """
+        model = None
+        if self.content_type_id:
+            model = ContentType.objects.get_for_id(self.content_type_id).model_class()
+        self.unique_role = True if self.role.unique is True and model else None
+        self.unique_object = True if model and is_unique_together(model) else None
+
+    @staticmethod
+    def get_accesses(role_class):
+        """
+        Return the list of (Permission id, access)
+        stored for each assignment of the role class,
+        based on "allow" or "deny".
+        """
+        role = get_roleclass(role_class)
+
         # non-object roles does not have specific
         # permissions auto created.
-        if self.role.models == ALL_MODELS:
-            return
-
-        all_perms = get_permissions_list(self.role.get_models())
+        if role.models == ALL_MODELS:
+            return list()
 
-        # Filtering the permissions based
-        # on "allow" or "deny".
-        role_instances = list()
-        for perm in all_perms:
-            access = None
-            perm_s = permission_to_string(perm)
-            if self.role.get_mode() == ALLOW_MODE:
-                # [Allow Mode]
-                # Put the access as "True" only for
-                # the permissions in allow list.
-                access = True if perm_s in self.role.allow else False
-            else:
-                # [Deny Mode]
-                # Put the access as "False" only for
-                # the permissions in deny list.
-                access = False if perm_s in self.role.deny else True
-            role_instances.append(RolePermission(role=self, permission=perm, access=access))
+        # Using sparse storage, the default
+        # permissions come from the role class.
+        if get_config('SPARSE', False):
+            return list()
 
-        RolePermission.objects.bulk_create(role_instances)
+        policy = RoleManager.get_policy(role)
+        return [(perm_id, policy.access_check(perm_id))
+                for perm_id in policy.get_model_permission_ids()]
 
 
 class RolePermission(models.Model):
@@ -0,0 +1,120 @@
+"""pages functions"""
+from collections import OrderedDict
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Q
+
+from improved_permissions.getters import get_objects_roles, get_users
+from improved_permissions.models import UserRole
+from improved_permissions.utils import get_roleclass
+
+
+def get_page(query, cursor=None, limit=100):
+    """
+    Return a page of "limit" instances of "query"
+    ordered by their primary keys, starting after
+    "cursor", and the cursor of the next page.
+
+    The cursor is the last primary key of the
+    page, so the index is used to reach any
+    page instead of an OFFSET.
+    """
+    if cursor is not None:
+        query = query.filter(pk__gt=cursor)
+
+    # One more instance tells if
+    # there is a next page.
+    page = list(query.order_by('pk')[:limit + 1])
+    if len(page) > limit:
+        page = page[:limit]
+        return page, page[-1].pk
+    return page, None
+
+
+def get_users_page(role_class=None, obj=None, cursor=None, limit=100):
+    """
+    Return a page of "limit" users of "get_users"
+    ordered by their primary keys and the cursor
+    of the next page, or None if it is the last one.
+    """
+    return get_page(get_users(role_class, obj), cursor, limit)
+
+
+def iter_users(role_class=None, obj=None, chunk_size=2000):
+    """
+    Iterate over the users of "get_users",
+    fetching them in pages of "chunk_size".
+    """
+    cursor = None
+    while True:
+        users_list, cursor = get_users_page(role_class, obj, cursor, chunk_size)
+        yield from users_list
+        if cursor is None:
+            break
+
+
+def get_objects_page(user, role_class=None, model=None, cursor=None, limit=100):
+    """
+    Return a page of "limit" objects of "get_objects"
+    ordered by their content types and primary keys
+    and the cursor of the next page, or None if it
+    is the last one. The objects which no longer
+    exist are left out of their pages.
+
+    The cost of each page is the same regardless
+    of the cursor: one query for the keys of the
+    objects and one query for each model in the page.
+    """
+    query = (get_objects_roles(user, role_class, model)
+             .values_list('content_type', 'object_id')
+             .order_by('content_type', 'object_id')
+             .distinct())
+    if cursor is not None:
+        query = query.filter(Q(content_type__gt=cursor[0]) |
+                             Q(content_type=cursor[0], object_id__gt=cursor[1]))
+
+    # One more key tells if
+    # there is a next page.
+    keys_list = list(query[:limit + 1])
+    cursor = None
+    if len(keys_list) > limit:
+        keys_list = keys_list[:limit]
+        cursor = keys_list[-1]
+    return get_objects_by_keys(keys_list), cursor
+
+
+def get_objects_by_keys(keys_list):
+    """
+    Return the objects of the (content type id,
+    primary key) tuples in "keys_list" in the same
+    order, using one query for each model.
+    """
+    grouped = OrderedDict()
+    for ct_id, obj_id in keys_list:
+        grouped.setdefault(ct_id, []).append(obj_id)
+
+    objs_dict = dict()
+    for ct_id, ids_list in grouped.items():
+        ct_model = ContentType.objects.get_for_id(ct_id).model_class()
+        if ct_model is None:
+            # The model was removed from the project.
+            continue
+        for obj_id, obj in ct_model._base_manager.in_bulk(ids_list).items():
+            objs_dict[(ct_id, obj_id)] = obj
+    return [objs_dict[key] for key in keys_list if key in objs_dict]
+
+
+def get_roles_page(user, obj=None, cursor=None, limit=100):
+    """
+    Return a page of "limit" role classes of
+    "get_roles" ordered by the role assignment
+    and the cursor of the next page, or None
+    if it is the last one.
+    """
+    query = UserRole.objects.filter(user=user).only('id', 'role_class')
+    if obj:
+        ct_obj = ContentType.objects.get_for_model(obj)
+        query = query.filter(content_type=ct_obj.id, object_id=obj.id)
+
+    ur_list, cursor = get_page(query, cursor, limit)
+    return [get_roleclass(ur_obj.role_class) for ur_obj in ur_list], cursor
@@ -1,7 +1,11 @@
 """ definition of role and rolemanager """
+import threading
+from collections import namedtuple
+
 from django.apps import apps
 
-from improved_permissions.exceptions import ImproperlyConfigured, NotAllowed
+from improved_permissions.exceptions import (ImproperlyConfigured, NotAllowed,
+                                             RoleNotFound)
 from improved_permissions.utils import get_model
 
 ALLOW_MODE = 0
@@ -10,6 +14,12 @@ DENY_MODE = 1
 ALL_MODELS = -1
 
 
+# Immutable snapshot of the registered
+# role classes, replaced as a whole on
+# every change.
+RoleRegistry = namedtuple('RoleRegistry', ['roles', 'classes', 'policies', 'models', 'unique_names'])
+
+
 class RoleManager(object):
     """
     RoleManager
@@ -19,7 +29,10 @@ class RoleManager(object):
     and in use by the project.
 
     """
-    __ROLE_CLASSES_LIST = list()
+    __REGISTRY = RoleRegistry(
+        roles=(), classes=dict(), policies=dict(), models=dict(), unique_names=frozenset()
+    )
+    __LOCK = threading.RLock()
 
     def __new__(cls, *args, **kwargs):  # pylint: disable=unused-argument
         raise ImproperlyConfigured('RoleManager must not be instantiated.')
@@ -31,35 +44,76 @@ class RoleManager(object):
         class in the Manager to be used
         in the project.
         """
-        from improved_permissions.utils import is_role
+        cls.register_roles([new_class])
 
-        # Check if is actually a role class.
-        if not is_role(new_class):
-            raise ImproperlyConfigured(
-                '"%s" is not a class inherited '
-                'from Role.' % str(new_class)
-            )
-
-        # Looking for name conflits or if this
-        # class was already registered before.
-        new_name = new_class.get_class_name()
-        for current_class in cls.__ROLE_CLASSES_LIST:
-            current_name = current_class.get_class_name()
-            if current_class == new_class:
-                raise ImproperlyConfigured(
-                    '"%s" was already registered as '
-                    'a valid Role class.' % new_name
-                )
+    @classmethod
+    def register_roles(cls, classes_list, replace=False):
+        """
+        Validate and register all Role classes
+        of "classes_list" at once. If "replace"
+        is True, the current ones are dropped.
 
-            elif current_name == new_name:
-                raise ImproperlyConfigured(
-                    '"Another role was already defined using '
-                    '"%s". Choose another name for this Role '
-                    'class.' % current_name
-                )
+        The registry is replaced atomically, so
+        concurrent lookups see either all or
+        none of the changes.
+        """
+        from improved_permissions.utils import is_role, register_cleanup
+
+        with cls.__LOCK:
+            registry = cls.__REGISTRY
+            roles = () if replace else registry.roles
+            classes = dict() if replace else dict(registry.classes)
+            policies = dict() if replace else dict(registry.policies)
+            models = dict() if replace else dict(registry.models)
+
+            for new_class in classes_list:
+                # Check if is actually a role class.
+                if not is_role(new_class):
+                    raise ImproperlyConfigured(
+                        '"%s" is not a class inherited '
+                        'from Role.' % str(new_class)
+                    )
+
+                # Looking for name conflits or if this
+                # class was already registered before.
+                new_name = new_class.get_class_name()
+                if new_class in classes:
+                    raise ImproperlyConfigured(
+                        '"%s" was already registered as '
+                        'a valid Role class.' % new_name
+                    )
+
+                elif new_name in classes:
+                    raise ImproperlyConfigured(
+                        '"Another role was already defined using '
+                        '"%s". Choose another name for this Role '
+                        'class.' % new_name
+                    )
+
+                cls.__validate(new_class)
+                roles += (new_class,)
+                classes[new_class] = new_class
+                classes[new_name] = new_class
+
+                # Compiling the role class in order
+                # to speed up all permission checks.
+                policy = RolePolicy.compile(new_class)
+                policies[new_class] = policy
+                policies[new_name] = policy
+
+                # Reverse index of the models.
+                for model in policy.models:
+                    models[model] = models.get(model, ()) + (new_class,)
+
+            unique_names = frozenset(role.get_class_name() for role in roles if role.unique is True)
+            cls.__REGISTRY = RoleRegistry(
+                roles=roles, classes=classes, policies=policies, models=models,
+                unique_names=unique_names
+            )
 
-        cls.__validate(new_class)
-        cls.__ROLE_CLASSES_LIST.append(new_class)
+            # The models of the new roles
+            # may need the cleanup signal.
+            register_cleanup()
 
     @classmethod
     def get_roles(cls):
@@ -68,7 +122,68 @@ class RoleManager(object):
         all registered Role
         classes.
         """
-        return list(cls.__ROLE_CLASSES_LIST)
+        return list(cls.__REGISTRY.roles)
+
+    @classmethod
+    def get_role(cls, role_class):
+        """
+        Return a registered Role class
+        using the class itself or its name.
+        """
+        try:
+            return cls.__REGISTRY.classes[role_class]
+        except (KeyError, TypeError):
+            raise RoleNotFound(
+                "'%s' is not a registered role class." % role_class
+            )
+
+    @classmethod
+    def get_model_roles(cls, model):
+        """
+        Return the list of all registered Role
+        classes which can be attached to the
+        model class, instance or ContentType id.
+        """
+        if isinstance(model, int):
+            from django.contrib.contenttypes.models import ContentType
+            model = ContentType.objects.get_for_id(model).model_class()
+
+        opts = getattr(model, '_meta', None)
+        if opts is None:
+            return list()
+        return list(cls.__REGISTRY.models.get(opts.model, ()))
+
+    @classmethod
+    def get_unique_names(cls):
+        """
+        Return the frozenset of the names of
+        all registered Role classes using
+        unique=True.
+        """
+        return cls.__REGISTRY.unique_names
+
+    @classmethod
+    def get_policy(cls, role_class):
+        """
+        Return the compiled RolePolicy of
+        a registered Role class, using the
+        class itself or its name.
+        """
+        try:
+            return cls.__REGISTRY.policies[role_class]
+        except (KeyError, TypeError):
+            raise RoleNotFound(
+                "'%s' is not a registered role class." % role_class
+            )
+
+    @classmethod
+    def clear_ids(cls):
+        """
+        Erase the Permission ids resolved
+        by all compiled policies.
+        """
+        for policy in cls.__REGISTRY.policies.values():
+            policy.ids.clear()
 
     @classmethod
     def cleanup(cls):
@@ -76,7 +191,10 @@ class RoleManager(object):
         Flush the current list of all
         Roles registered in the project.
         """
-        cls.__ROLE_CLASSES_LIST = list()
+        with cls.__LOCK:
+            cls.__REGISTRY = RoleRegistry(
+                roles=(), classes=dict(), policies=dict(), models=dict(), unique_names=frozenset()
+            )
 
     @classmethod
     def __validate(cls, new_class):  # pylint: disable=too-many-branches
@@ -199,6 +317,133 @@ class RoleManager(object):
         return result
 
 
+class RolePolicy(namedtuple('RolePolicy', [
+        'role', 'name', 'mode', 'inherit', 'inherit_mode', 'ranking', 'unique',
+        'models', 'models_set', 'allow', 'deny', 'inherit_allow', 'inherit_deny',
+        'ids'])):
+    """
+    RolePolicy
+
+    Immutable and precompiled version of
+    a Role class. All permissions are kept
+    in frozensets, so every check is a
+    single set lookup.
+
+    """
+    __slots__ = ()
+
+    @classmethod
+    def compile(cls, role):
+        """
+        Build the policy of an already
+        validated Role class.
+        """
+        inherit_mode = role.INHERIT_MODE if role.inherit is True else None
+        if role.models == ALL_MODELS:
+            models = tuple(apps.get_models())
+        else:
+            models = tuple(role.models)
+        return cls(
+            role=role,
+            name=role.get_class_name(),
+            mode=role.MODE,
+            inherit=role.inherit,
+            inherit_mode=inherit_mode,
+            ranking=role.ranking,
+            unique=role.unique,
+            models=models,
+            models_set=frozenset(models),
+            allow=frozenset(getattr(role, 'allow', [])),
+            deny=frozenset(getattr(role, 'deny', [])),
+            inherit_allow=frozenset(getattr(role, 'inherit_allow', [])),
+            inherit_deny=frozenset(getattr(role, 'inherit_deny', [])),
+            ids=dict(),
+        )
+
+    def get_ids(self, field):
+        """
+        Return the frozenset of Permission ids of
+        "allow", "deny", "inherit_allow" or
+        "inherit_deny". All of them are resolved
+        at once in the first call.
+        """
+        if field not in self.ids:
+            from improved_permissions.utils import get_permissions_ids
+
+            fields = ['allow', 'deny', 'inherit_allow', 'inherit_deny']
+            strings = set()
+            for name in fields:
+                strings.update(getattr(self, name))
+
+            perms_dict = get_permissions_ids(strings)
+            for name in fields:
+                perms = getattr(self, name)
+                self.ids[name] = frozenset(perms_dict[p] for p in perms if p in perms_dict)
+
+        return self.ids[field]
+
+    def get_content_type_ids(self):
+        """
+        Return the frozenset of ContentType
+        ids of all models of the role.
+        """
+        if 'content_types' not in self.ids:
+            from django.contrib.contenttypes.models import ContentType
+
+            ct_dict = ContentType.objects.get_for_models(*self.models)
+            self.ids['content_types'] = frozenset(ct.id for ct in ct_dict.values())
+        return self.ids['content_types']
+
+    def get_model_permission_ids(self):
+        """
+        Return the frozenset of Permission ids
+        of all models of the role. Roles using
+        ALL_MODELS do not have any of them.
+        """
+        if 'models' not in self.ids:
+            from django.contrib.auth.models import Permission
+
+            perms = frozenset()
+            if self.role.models != ALL_MODELS:
+                query = Permission.objects.filter(content_type__in=self.get_content_type_ids())
+                perms = frozenset(query.values_list('id', flat=True))
+            self.ids['models'] = perms
+        return self.ids['models']
+
+    def access_check(self, perm_id):
+        """
+        Return the default access of the
+        role to a Permission id of one of
+        its own models.
+        """
+        if self.mode == ALLOW_MODE:
+            return perm_id in self.get_ids('allow')
+        return perm_id not in self.get_ids('deny')
+
+    def inherit_check(self, permission):
+        """
+        Return the access of the role to
+        a permission string in inherit mode.
+        """
+        if self.inherit is True:
+            if self.inherit_mode == ALLOW_MODE:
+                return permission in self.inherit_allow
+            return permission not in self.inherit_deny
+        return False
+
+    def default_check(self, perm_id, permission):
+        """
+        Return the access of the role to a
+        permission without RolePermission
+        stored for it: the default access for
+        its own models, otherwise the access
+        in inherit mode.
+        """
+        if perm_id in self.get_model_permission_ids():
+            return self.access_check(perm_id)
+        return self.inherit_check(permission)
+
+
 class Role(object):
     """
     Role
@@ -244,11 +489,22 @@ class Role(object):
     @classmethod
     def get_models(cls):
         cls.__protect()
-        if cls.models == ALL_MODELS:
-            return list(apps.get_models())  # All models known by Django.
-        return list(cls.models)
+        try:
+            return list(RoleManager.get_policy(cls).models)
+        except RoleNotFound:
+            # Not registered yet.
+            if cls.models == ALL_MODELS:
+                return list(apps.get_models())  # All models known by Django.
+            return list(cls.models)
 
     @classmethod
     def is_my_model(cls, model):
         cls.__protect()
-        return model._meta.model in cls.get_models()  # pylint: disable=protected-access
+        opts = getattr(model, '_meta', None)
+        if opts is None:
+            return False
+        try:
+            return opts.model in RoleManager.get_policy(cls).models_set
+        except RoleNotFound:
+            # Not registered yet.
+            return opts.model in cls.get_models()
@@ -1,5 +1,5 @@
 """ permissions shortcuts """
-from improved_permissions import assignments, checkers, getters
+from improved_permissions import assignments, checkers, getters, pages
 
 
 def get_user(role_class=None, obj=None):
@@ -10,10 +10,34 @@ def get_users(role_class=None, obj=None):
     return getters.get_users(role_class, obj)
 
 
+def get_user_ids(role_class=None, obj=None):
+    return getters.get_user_ids(role_class, obj)
+
+
+def get_users_page(role_class=None, obj=None, cursor=None, limit=100):
+    return pages.get_users_page(role_class, obj, cursor, limit)
+
+
+def iter_users(role_class=None, obj=None, chunk_size=2000):
+    return pages.iter_users(role_class, obj, chunk_size)
+
+
 def get_objects(user, role_class=None, model=None):
     return getters.get_objects(user, role_class, model)
 
 
+def get_objects_querysets(user, role_class=None, model=None):
+    return getters.get_objects_querysets(user, role_class, model)
+
+
+def iter_objects(user, role_class=None, model=None, chunk_size=2000):
+    return getters.iter_objects(user, role_class, model, chunk_size)
+
+
+def get_objects_page(user, role_class=None, model=None, cursor=None, limit=100):
+    return pages.get_objects_page(user, role_class, model, cursor, limit)
+
+
 def get_role(user, obj=None):
     return getters.get_role(user, obj)
 
@@ -22,14 +46,30 @@ def get_roles(user, obj=None):
     return getters.get_roles(user, obj)
 
 
+def get_roles_page(user, obj=None, cursor=None, limit=100):
+    return pages.get_roles_page(user, obj, cursor, limit)
+
+
 def has_role(user, role_class=None, obj=None):
     return checkers.has_role(user, role_class, obj)
 
 
+def has_roles(user, role_class, objs_list):
+    return checkers.has_roles(user, role_class, objs_list)
+
+
 def has_permission(user, permission, obj=None, any_object=False, persistent=None):
     return checkers.has_permission(user, permission, obj, any_object, persistent)
 
 
+def has_permissions(user, permission, objs_list, persistent=None):
+    return checkers.has_permissions(user, permission, objs_list, persistent)
+
+
+def filter_queryset(user, permission, queryset, persistent=None):
+    return checkers.filter_queryset(user, permission, queryset, persistent)
+
+
 def assign_role(user, role_class, obj=None):
     assignments.assign_role(user, role_class, obj)
 
@@ -38,6 +78,10 @@ def assign_roles(users_list, role_class, obj=None):
     assignments.assign_roles(users_list, role_class, obj)
 
 
+def bulk_assign_roles(users_list, role_class, objs_list):
+    assignments.bulk_assign_roles(users_list, role_class, objs_list)
+
+
 def remove_role(user, role_class=None, obj=None):
     assignments.remove_role(user, role_class, obj)
 
@@ -1,12 +1,37 @@
 """ permissions utils """
 # pylint: disable=too-many-lines
 import inspect
+import threading
+from contextlib import contextmanager
+from functools import partial
 
 from improved_permissions.exceptions import (ImproperlyConfigured, NotAllowed,
-                                             ParentNotFound, RoleNotFound)
+                                             ParentNotFound)
 
 CACHE_KEY_PREFIX = 'dip'
 
+# Compiled "permission_parents" paths of
+# each model, used by get_ancestors.
+ANCESTORS_PATHS = dict()
+
+# ContentType ids of each model
+# class, used by get_object_key.
+CONTENT_TYPES = dict()
+
+# Permission ids of each string
+# representation "app_label.codename".
+PERMISSIONS = dict()
+PERMISSIONS_LOCK = threading.Lock()
+PERMISSIONS_LOADED = threading.Event()
+
+# Objects deleted in the current
+# transaction of each database.
+CLEANUP = threading.local()
+
+# Storage of the memo layer enabled
+# by "permission_memo".
+MEMO = threading.local()
+
 
 def is_role(role_class):
     """
@@ -37,9 +62,24 @@ def dip_cache():
     """
     Proxy method used to get the cache
     object belonging to the DIP.
+
+    If "LOCAL_CACHE_SIZE" is provided, an
+    in-process LRU cache is placed in front
+    of it.
     """
     from django.core.cache import caches
-    return caches[get_config('CACHE', 'default')]
+
+    alias = get_config('CACHE', 'default')
+    max_entries = get_config('LOCAL_CACHE_SIZE', 0)
+    if max_entries:
+        from improved_permissions.cache import LocalCache, LocalOptions
+        options = LocalOptions(
+            max_entries,
+            get_config('LOCAL_CACHE_TIMEOUT', 5),
+            get_config('LOCAL_CACHE_INTERVAL', 1),
+        )
+        return LocalCache.get_instance(alias, get_config('CACHE_PREFIX_KEY', CACHE_KEY_PREFIX), options)
+    return caches[alias]
 
 
 def autodiscover():
@@ -59,22 +99,34 @@ def autodiscover():
     except:  # pragma: no cover
         return
 
-    # Remove all references about previous
-    # role classes and erase all cache.
-    RoleManager.cleanup()
+    # Erase all cache about
+    # previous role classes.
     dip_cache().clear()
 
     # Looking for Role classes in "roles.py".
     module = get_config('MODULE', 'roles')
+    rc_list = list()
     for app in settings.INSTALLED_APPS:
         try:
             mod = import_module('%s.%s' % (app, module))
-            rc_list = [obj[1] for obj in inspect.getmembers(mod, is_role)]
-            for roleclass in rc_list:
-                RoleManager.register_role(roleclass)
+            rc_list.extend(obj[1] for obj in inspect.getmembers(mod, is_role))
         except ImportError:
             pass
 
+    # Replacing all previous role
+    # classes at once.
+    RoleManager.register_roles(rc_list, replace=True)
+
+    # Compiling the parents of all models.
+    from django.apps import apps
+    ANCESTORS_PATHS.clear()
+    for model in apps.get_models():
+        try:
+            get_ancestors_paths(model)
+        except ParentNotFound:
+            # Raised again when the model is used.
+            pass
+
     # Clear the cache again after
     # all registrations.
     dip_cache().clear()
@@ -86,22 +138,7 @@ def get_roleclass(role_class):
     by string or by itself.
     """
     from improved_permissions.roles import RoleManager
-    roles_list = RoleManager.get_roles()
-
-    if isinstance(role_class, str):
-        # Trying to get the role class
-        # via string representation.
-        for role in roles_list:
-            if role.get_class_name() == role_class:
-                return role
-
-    elif role_class in roles_list:
-        # Already a Role class.
-        return role_class
-
-    raise RoleNotFound(
-        "'%s' is not a registered role class." % role_class
-    )
+    return RoleManager.get_role(role_class)
 
 
 def get_model(model):
@@ -124,55 +161,93 @@ def get_model(model):
     return result
 
 
-def string_to_permission(perm):
+def load_permissions():
     """
-    Transforms a string representation
-    into a Permission instance.
+    Fill the registry with all Permissions
+    of the database using a single query.
     """
     from django.contrib.auth.models import Permission
 
-    # Checking if the Permission instance
-    # exists in the cache system.
-    prefix = get_config('CACHE_PREFIX_KEY', CACHE_KEY_PREFIX)
-    key = '{}-permission-{}'.format(prefix, perm)
-    perm_obj = dip_cache().get(key)
-
-    # If not, creates the query to
-    # get the Permission instance
-    # and store into the cache.
-    if perm_obj is None:
-        app, codename = perm.split('.')
-        perm_obj = (Permission.objects
-                    .select_related('content_type')
-                    .filter(content_type__app_label=app, codename=codename)
-                    .get())
-        dip_cache().set(key, perm_obj)
-
-    return perm_obj
+    query = Permission.objects.values_list('id', 'content_type__app_label', 'codename')
+    with PERMISSIONS_LOCK:
+        for perm_id, app_label, codename in query:
+            PERMISSIONS['%s.%s' % (app_label, codename)] = perm_id
+        PERMISSIONS_LOADED.set()
 
 
-def permission_to_string(perm):
+def get_permissions_ids(perms_list):
     """
-    Transforms a Permission instance
-    into a string representation.
+    Return a dictionary mapping each string
+    representation in "perms_list" to its
+    Permission id, using the registry of the
+    process. Unknown strings are searched in
+    the database with a single query and the
+    ones which do not exist are left out.
     """
-    app_label = perm.content_type.app_label
-    codename = perm.codename
-    return '%s.%s' % (app_label, codename)
+    from django.contrib.auth.models import Permission
+    from django.db.models import Q
+
+    if not PERMISSIONS_LOADED.is_set():
+        load_permissions()
+
+    result = dict()
+    missing = list()
+    for perm in perms_list:
+        perm_id = PERMISSIONS.get(perm)
+        if perm_id is None:
+            missing.append(perm)
+        else:
+            result[perm] = perm_id
+
+    if missing:
+        condition = Q(pk__in=[])
+        for perm in missing:
+            app_label, dummy, codename = perm.partition('.')
+            condition |= Q(content_type__app_label=app_label, codename=codename)
+
+        query = Permission.objects.filter(condition).values_list(
+            'id', 'content_type__app_label', 'codename'
+        )
+        with PERMISSIONS_LOCK:
+            for perm_id, app_label, codename in query:
+                perm = '%s.%s' % (app_label, codename)
+                PERMISSIONS[perm] = perm_id
+                result[perm] = perm_id
+
+    return result
 
 
-def get_permissions_list(models_list):
+def get_permission_id(perm):
     """
-    Given a list of Model instances or a Model
-    classes, return all Permissions related to it.
+    Transforms a string representation
+    into a Permission id.
     """
     from django.contrib.auth.models import Permission
-    from django.contrib.contenttypes.models import ContentType
 
-    ct_list = ContentType.objects.get_for_models(*models_list)
-    ct_ids = [ct.id for cls, ct in ct_list.items()]
+    perm_id = PERMISSIONS.get(perm)
+    if perm_id is None:
+        perm_id = get_permissions_ids([perm]).get(perm)
+        if perm_id is None:
+            raise Permission.DoesNotExist(
+                "The permission '%s' does not exist." % perm
+            )
+    return perm_id
 
-    return list(Permission.objects.filter(content_type_id__in=ct_ids))
+
+def clear_registry(**kwargs):  # pylint: disable=unused-argument
+    """
+    Erase the Permission and ContentType ids
+    kept by the process, including the ones of
+    the compiled roles. Connected to the
+    post_migrate signal.
+    """
+    from improved_permissions.roles import RoleManager
+
+    with PERMISSIONS_LOCK:
+        PERMISSIONS_LOADED.clear()
+        PERMISSIONS.clear()
+    CONTENT_TYPES.clear()
+    RoleManager.clear_ids()
 
 
 def get_parents(model):
@@ -197,6 +272,230 @@ def get_parents(model):
     return result
 
 
+def get_parents_paths(model, max_depth=None):
+    """
+    Return the list of (path, model) tuples of
+    all "parents" of a given model class, in the
+    same order they are visited by has_permission.
+    The first item is the model itself.
+
+    All parents must be ForeignKey or OneToOne
+    fields in order to be used in queries. Models
+    with recursive parents are only accepted if
+    "max_depth" is provided.
+    """
+    from django.core.exceptions import FieldDoesNotExist
+
+    result = list()
+    depth = 0
+    level = [('', model, (model,))]
+    while level:
+        result.extend((path, current) for path, current, dummy in level)
+
+        # Checking the maximum depth.
+        if max_depth is not None and depth >= max_depth:
+            break
+        depth += 1
+
+        next_level = list()
+        for path, current, ancestry in level:
+            options = getattr(current, 'RoleOptions', None)
+            for parent in getattr(options, 'permission_parents', None) or []:
+                try:
+                    field = current._meta.get_field(parent)  # pylint: disable=protected-access
+                except FieldDoesNotExist:
+                    raise ParentNotFound('The field "%s" was not found in the '
+                                         'model "%s".' % (parent, str(current)))
+
+                if not (field.concrete and (field.many_to_one or field.one_to_one)):
+                    raise NotAllowed('The parent "%s" of the model "%s" must be a '
+                                     'ForeignKey or OneToOneField to be used in '
+                                     'queries.' % (parent, str(current)))
+
+                related = field.related_model
+                if related in ancestry and max_depth is None:
+                    raise ImproperlyConfigured('The model "%s" has recursive "permission_parents". '
+                                               'Use "MAX_PARENTS_DEPTH" in order to limit '
+                                               'them.' % str(model))
+
+                new_path = '%s__%s' % (path, parent) if path else parent
+                next_level.append((new_path, related, ancestry + (related,)))
+        level = next_level
+
+    return result
+
+
+def get_object_key(obj):
+    """
+    Return the (content type id, primary key)
+    tuple that identifies a model instance.
+    Tuples are returned as they are.
+    """
+    if isinstance(obj, tuple):
+        return obj
+
+    ct_id = CONTENT_TYPES.get(obj.__class__)
+    if ct_id is None:
+        from django.contrib.contenttypes.models import ContentType
+        ct_id = ContentType.objects.get_for_model(obj).id
+        CONTENT_TYPES[obj.__class__] = ct_id
+    return (ct_id, obj.pk)
+
+
+def get_ancestors_paths(model):
+    """
+    Return the compiled list of (path, model, attname)
+    tuples of all "parents" of a given model class.
+    The "attname" is only set for the direct parents,
+    whose primary keys are already in the instance.
+
+    Return None if the parents cannot be resolved
+    using queries, e.g. they are not ForeignKeys.
+    """
+    max_depth = get_config('MAX_PARENTS_DEPTH', None)
+    if (model, max_depth) not in ANCESTORS_PATHS:
+        try:
+            paths_list = get_parents_paths(model, max_depth)[1:]
+        except (ImproperlyConfigured, NotAllowed, ParentNotFound):
+            # Parents which are not model fields,
+            # like properties, use the instances.
+            paths_list = None
+
+        if paths_list is not None:
+            result = list()
+            for path, parent_model in paths_list:
+                attname = None
+                if '__' not in path:
+                    attname = model._meta.get_field(path).attname  # pylint: disable=protected-access
+                result.append((path, parent_model, attname))
+            paths_list = result
+
+        ANCESTORS_PATHS[(model, max_depth)] = paths_list
+    return ANCESTORS_PATHS[(model, max_depth)]
+
+
+def get_ancestors(obj):
+    """
+    Generate the keys of all parents of a given
+    model instance, in the same order they are
+    visited by has_permission. Each parent is
+    generated only once.
+
+    The direct parents are taken from the instance
+    and all others are fetched using a single
+    query, only if they are required.
+    """
+    model = obj.__class__
+    paths_list = get_ancestors_paths(model)
+    visited = set([get_object_key(obj)])
+
+    if paths_list is None:
+        # Walking through the
+        # instances themselves.
+        yield from walk_parents(obj, visited)
+        return
+
+    # The direct parents come first and
+    # their keys are in the instance.
+    direct = [item for item in paths_list if item[2]]
+    yield from get_cached_ancestors(obj, direct, None, visited)
+
+    deeper = [item for item in paths_list if not item[2]]
+    if deeper:
+        names = [item[0] for item in deeper]
+        row = (model._base_manager  # pylint: disable=protected-access
+               .filter(pk=obj.pk).values_list(*names).first())
+        values = dict(zip(names, row or [None] * len(names)))
+        yield from get_cached_ancestors(obj, deeper, values, visited)
+
+
+def walk_parents(obj, visited):
+    """
+    Generate the keys of all parents of a given
+    model instance using the instances themselves.
+    The parents in "visited" are not walked again,
+    so recursive parents are safe.
+    """
+    max_depth = get_config('MAX_PARENTS_DEPTH', None)
+
+    depth = 0
+    level = [obj]
+    while level and (max_depth is None or depth < max_depth):
+        depth += 1
+        next_level = list()
+        for current in level:
+            for parent in get_parents(current):
+                key = get_object_key(parent)
+                if key not in visited:
+                    visited.add(key)
+                    next_level.append(parent)
+                    yield key
+        level = next_level
+
+
+def get_many_ancestors(objs_list):
+    """
+    Same as "get_ancestors", but for a list of objects
+    at once. The parents of all instances of the same
+    model are fetched using a single query.
+
+    Return a dictionary mapping the key of each
+    object to the list of keys of its parents.
+    """
+    result = dict()
+
+    grouped = dict()
+    for obj in objs_list:
+        grouped.setdefault(obj.__class__, []).append(obj)
+
+    for model, instances in grouped.items():
+        paths_list = get_ancestors_paths(model)
+        deeper = [item[0] for item in paths_list or [] if not item[2]]
+
+        rows = dict()
+        if paths_list is None:
+            # Loading all instances at once,
+            # so the walk does not hit the
+            # database anymore.
+            load_parents(instances)
+        elif deeper:
+            query = (model._base_manager  # pylint: disable=protected-access
+                     .filter(pk__in=[obj.pk for obj in instances])
+                     .values_list('pk', *deeper))
+            rows = {row[0]: row[1:] for row in query}
+
+        for obj in instances:
+            if paths_list is None:
+                ancestors = get_ancestors(obj)
+            else:
+                values = dict(zip(deeper, rows.get(obj.pk) or [None] * len(deeper)))
+                visited = set([get_object_key(obj)])
+                ancestors = get_cached_ancestors(obj, paths_list, values, visited)
+            result[get_object_key(obj)] = list(ancestors)
+
+    return result
+
+
+def get_cached_ancestors(obj, paths_list, values, visited):
+    """
+    Generate the keys of all parents of a given
+    model instance using the values of the deeper
+    parents already fetched from the database.
+    The keys in "visited" are skipped.
+    """
+    from django.contrib.contenttypes.models import ContentType
+
+    for path, parent_model, attname in paths_list:
+        value = getattr(obj, attname) if attname else values[path]
+
+        # Only getting non-null parents.
+        if value is not None:
+            key = (ContentType.objects.get_for_model(parent_model).id, value)
+            if key not in visited:
+                visited.add(key)
+                yield key
+
+
 def is_unique_together(model):
     """
     Return True if the model does not
@@ -214,52 +513,170 @@ def is_unique_together(model):
     return False
 
 
+def has_unique_constraints():
+    """
+    Return True if the database enforces the
+    unique constraints of UserRole using the
+    unique marks, which requires NULL values
+    to be distinct from each other.
+    """
+    from django.db import connections, router
+    from improved_permissions.models import UserRole
+
+    vendor = connections[router.db_for_write(UserRole)].vendor
+    return vendor in ('postgresql', 'sqlite', 'mysql')
+
+
 def inherit_check(role_s, permission):
     """
     Check if the role class has the following
     permission in inherit mode.
     """
-    from improved_permissions.roles import ALLOW_MODE
+    from improved_permissions.roles import RoleManager
+    return RoleManager.get_policy(role_s).inherit_check(permission)
 
-    role = get_roleclass(role_s)
-    if role.inherit is True:
-        if role.get_inherit_mode() == ALLOW_MODE:
-            return True if permission in role.inherit_allow else False
-        return False if permission in role.inherit_deny else True
-    return False
+
+def default_check(role_s, perm_id, permission):
+    """
+    Check if the role class has the following
+    permission when there is no RolePermission
+    stored for it.
+
+    Using the "SPARSE" setting, only the changes
+    made by "assign_permission" are stored, so
+    the default access is derived from the role
+    class. Otherwise, only the inherit mode is
+    left to be checked.
+    """
+    from improved_permissions.roles import RoleManager
+
+    policy = RoleManager.get_policy(role_s)
+    if get_config('SPARSE', False):
+        return policy.default_check(perm_id, permission)
+    return policy.inherit_check(permission)
 
 
-def cleanup_handler(sender, instance, **kwargs):  # pylint: disable=unused-argument
+def cleanup_handler(sender, instance, using=None, **kwargs):  # pylint: disable=unused-argument
     """
     This function is attached to the post_delete
     signal of all models of Django. Used to remove
     useless role instances and permissions.
+
+    The deleted objects are buffered during the
+    transaction and all of their role instances
+    are removed at once after the commit.
     """
-    from django.contrib.contenttypes.models import ContentType
+    from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+    using = using or DEFAULT_DB_ALIAS
+    connection = connections[using]
+    obj_key = get_object_key(instance)
+    if not connection.in_atomic_block:
+        flush_cleanup([obj_key], using)
+        return
+
+    pending = getattr(CLEANUP, 'pending', None)
+    if pending is None:
+        pending = CLEANUP.pending = dict()
+
+    # Each savepoint has its own buffer, which is
+    # discarded along with its callback if the
+    # savepoint is rolled back.
+    keys_list, callback = pending.get(using, (None, None))
+    savepoints = set(connection.savepoint_ids)
+    if not any(item[1] is callback and item[0] == savepoints
+               for item in connection.run_on_commit):
+        keys_list = list()
+        callback = partial(flush_cleanup, keys_list, using)
+        pending[using] = (keys_list, callback)
+        transaction.on_commit(callback, using=using)
+    keys_list.append(obj_key)
+
+
+def flush_cleanup(keys_list, using):
+    """
+    Remove all role instances of the objects
+    in "keys_list", using one query per chunk
+    of objects.
+    """
+    from improved_permissions.assignments import delete_roles
     from improved_permissions.models import UserRole
 
-    ct_obj = ContentType.objects.get_for_model(instance)
-    ur_list = UserRole.objects.filter(content_type=ct_obj.id, object_id=instance.id)
+    pending = getattr(CLEANUP, 'pending', None)
+    if pending and pending.get(using, (None,))[0] is keys_list:
+        del pending[using]
+
+    keys_list = list(set(keys_list))
+    for keys_chunk in chunks(keys_list):
+        delete_roles(UserRole.objects.using(using).filter(objects_condition(keys_chunk)))
 
-    for ur_obj in ur_list:
-        # Cleaning the cache system.
-        delete_from_cache(ur_obj.user, instance)
-        ur_obj.delete()
+    # The primary keys can be reused by new objects,
+    # so their generation counters are discarded.
+    if keys_list:
+        dip_cache().delete_many([get_generation_key(obj_key) for obj_key in keys_list])
+        clear_memo()
 
 
 def register_cleanup():
     """
     Register the function "cleanup_handler"
-    to all models in the project.
+    to the models which can be referenced by
+    the registered Role classes, dropping it
+    from all the other ones.
+
+    Role classes with ALL_MODELS are never
+    assigned with an object, so they do not
+    need the cleanup.
     """
     from django.apps import apps
     from django.db.models.signals import post_delete
-    from improved_permissions.models import UserRole, RolePermission
+    from improved_permissions.roles import ALL_MODELS, RoleManager
 
-    ignore = [UserRole, RolePermission]
+    if not apps.models_ready:
+        return
+
+    targets = set()
+    for role in RoleManager.get_roles():
+        if role.models != ALL_MODELS:
+            targets.update(model._meta.concrete_model for model in role.models)
+
+    # Proxy models send the signal
+    # using their own classes.
     for model in apps.get_models():
-        if model not in ignore and hasattr(model, 'id'):
+        if model._meta.concrete_model in targets and model._meta.app_label != 'improved_permissions':
             post_delete.connect(cleanup_handler, sender=model, dispatch_uid=str(model))
+        else:
+            post_delete.disconnect(sender=model, dispatch_uid=str(model))
+
+
+def chunks(items_list, size=500):
+    """
+    Split "items_list" in lists of "size"
+    items, keeping the queries below the
+    limit of parameters of the database.
+    """
+    for index in range(0, len(items_list), size):
+        yield items_list[index:index + size]
+
+
+def objects_condition(keys_list):
+    """
+    Return the condition of the UserRole instances
+    related to the object keys in "keys_list". The
+    key None stands for roles without object.
+    """
+    from django.db.models import Q
+
+    grouped = dict()
+    condition = Q(pk__in=[])
+    for key in keys_list:
+        if key is None:
+            condition |= Q(content_type__isnull=True, object_id__isnull=True)
+        else:
+            grouped.setdefault(key[0], []).append(key[1])
+    for ct_id, ids_list in grouped.items():
+        condition |= Q(content_type=ct_id, object_id__in=ids_list)
+    return condition
 
 
 def check_my_model(role, obj):
@@ -274,51 +691,303 @@ def check_my_model(role, obj):
                          '.' % (model_name, role.get_verbose_name()))
 
 
-def generate_cache_key(user, obj, any_object):
+def generate_cache_key(user, obj, any_object, generations=None):
     """
-    Generate a md5 digest based on the
-    string representation of the user
-    and the object passed via arguments.
+    Generate the cache key based on the keys of
+    the user and the object passed via arguments
+    and their current generations.
+
+    The generations are fetched from the cache
+    system, unless they are already in the
+    dictionary "generations".
     """
-    from hashlib import md5
+    if generations is None:
+        generations = dict()
 
-    key = md5()
-    str_key = str(user.__class__) + str(user) + str(user.id)
-    if obj:
-        str_key += str(obj.__class__) + str(obj) + str(obj.id)
+    user_key = get_object_key(user)
+    obj_key = get_object_key(obj) if obj else None
+
+    # Fetching only the missing generations.
+    needed = [item for item in (user_key, obj_key) if item and item not in generations]
+    if needed:
+        generations.update(get_generations(needed))
+
+    prefix = get_config('CACHE_PREFIX_KEY', CACHE_KEY_PREFIX)
+    key = '{}-userrole-{}-{}.{}'.format(prefix, user_key[0], user_key[1], generations[user_key])
+    if obj_key:
+        key += '-{}-{}.{}'.format(obj_key[0], obj_key[1], generations[obj_key])
     elif any_object:
-        str_key += 'any'
+        key += '-any'
+    return key
+
 
-    key.update(str_key.encode('utf-8'))
+def get_roles_key(user, obj, generations=None):
+    """
+    Return the cache key of the names of the role
+    classes of the user attached to the object, or
+    to any object if "obj" is None.
+    """
+    return generate_cache_key(user, obj, any_object=True, generations=generations) + '-roles'
+
+
+def get_roles_from_cache(user, keys_list):
+    """
+    Return a dictionary mapping each object key
+    of "keys_list" to the frozenset of the names
+    of the role classes attached to the user and
+    the object. The key None stands for any object.
+
+    Use a single "get_many" in the cache system
+    and a single query for all objects not found
+    in it.
+    """
+    from improved_permissions.models import UserRole
+
+    # Checking the memo layer.
+    result = dict()
+    memo = get_memo()
+    if memo is not None:
+        for obj_key in keys_list:
+            memo_key = ('roles', user.__class__, user.pk, obj_key)
+            if memo_key in memo:
+                result[obj_key] = memo[memo_key]
+
+    keys_list = [obj_key for obj_key in keys_list if obj_key not in result]
+    if not keys_list:
+        return result
+
+    generations = get_generations([user] + [obj_key for obj_key in keys_list if obj_key])
+    cache_keys = {get_roles_key(user, obj_key, generations): obj_key for obj_key in keys_list}
+    cached = dip_cache().get_many(list(cache_keys))
+    found = {cache_keys[key]: value for key, value in cached.items()}
+
+    missing = [obj_key for key, obj_key in cache_keys.items() if key not in cached]
+    if missing:
+        query = UserRole.objects.filter(user=user)
+        data = dict()
+
+        if None in missing:
+            # Any object: only the distinct names.
+            data[None] = frozenset(query.values_list('role_class', flat=True).order_by().distinct())
+            missing.remove(None)
+
+        if missing:
+            names = dict()
+            query = query.filter(objects_condition(missing))
+            for ct_id, obj_id, role_class in query.values_list('content_type', 'object_id', 'role_class'):
+                names.setdefault((ct_id, obj_id), set()).add(role_class)
+            for obj_key in missing:
+                data[obj_key] = frozenset(names.get(obj_key, ()))
+
+        dip_cache().set_many({key: data[obj_key] for key, obj_key in cache_keys.items()
+                              if obj_key in data})
+        found.update(data)
+
+    if memo is not None:
+        for obj_key, value in found.items():
+            memo[('roles', user.__class__, user.pk, obj_key)] = value
+    result.update(found)
+    return result
+
+
+def get_generation_key(obj):
+    """
+    Return the cache key of the generation
+    counter of a user or an object.
+    """
     prefix = get_config('CACHE_PREFIX_KEY', CACHE_KEY_PREFIX)
-    return '{}-userrole-{}'.format(prefix, key.hexdigest())
+    return '{}-generation-{}-{}'.format(prefix, *get_object_key(obj))
+
+
+def get_generations(objs_list):
+    """
+    Return a dictionary mapping the key of each
+    user or object to its generation counter,
+    using a single "get_many" in the cache system.
+
+    Missing counters start from a random value, so
+    keys created before an eviction are not reused.
+    They expire along with the data using them.
+    """
+    from random import getrandbits
+
+    memo = get_memo()
+    result = dict()
+    missing = dict()
+    for obj in objs_list:
+        obj_key = get_object_key(obj)
+        if memo is not None and ('generation', obj_key) in memo:
+            result[obj_key] = memo[('generation', obj_key)]
+        else:
+            missing[get_generation_key(obj_key)] = obj_key
+
+    if missing:
+        cached = dip_cache().get_many(list(missing))
+        for key, obj_key in missing.items():
+            value = cached.get(key)
+            if value is None:
+                value = getrandbits(32)
+                if not dip_cache().add(key, value):
+                    # Created by someone else.
+                    value = dip_cache().get(key, value)
+            result[obj_key] = value
+            if memo is not None:
+                memo[('generation', obj_key)] = value
+
+    return result
+
+
+def bump_generation(obj):
+    """
+    Increment the generation counter of a
+    user or an object. All cache keys using
+    the previous value are no longer used.
+    """
+    try:
+        dip_cache().incr(get_generation_key(obj))
+    except ValueError:
+        # A missing counter starts from
+        # a new random value anyway.
+        pass
+
+    # Cleaning the memo layer.
+    clear_memo()
+
+
+def invalidate_user_cache(user):
+    """
+    Invalidate all permissions data in
+    the cache about the user.
+    """
+    bump_generation(user)
+
+
+def invalidate_object_cache(obj):
+    """
+    Invalidate all permissions data in
+    the cache about the object.
+    """
+    bump_generation(obj)
 
 
 def delete_from_cache(user, obj):
     """
     Delete all permissions data from
-    the cache about the user and the
-    object passed via arguments.
+    the cache about the user passed via
+    arguments, including the object.
+    """
+    delete_many_from_cache([(user, obj)])
+
+
+def delete_many_from_cache(pairs_list):
+    """
+    Same as "delete_from_cache", but for a list
+    of (user, object) tuples at once. All cache
+    keys carry the generation of the user, so
+    the counters of the users are deleted using
+    a single "delete_many". Missing counters start
+    from a new random value, which discards all
+    keys using the previous ones.
+    """
+    keys = set(get_generation_key(user) for user, dummy in pairs_list)
+    if keys:
+        dip_cache().delete_many(list(keys))
+
+    # Cleaning the memo layer.
+    clear_memo()
+
+
+def delete_many_on_commit(pairs_list, using=None):
+    """
+    Run "delete_many_from_cache" once the current
+    transaction of the database "using" is committed,
+    so no other process keeps in the cache the data
+    read before it.
+
+    Inside a transaction, the data is deleted right
+    away as well, since this thread already sees
+    the changes. Each phase costs a single call
+    to the cache system.
+    """
+    from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+    using = using or DEFAULT_DB_ALIAS
+    transaction.on_commit(partial(delete_many_from_cache, pairs_list), using=using)
+    if connections[using].in_atomic_block:
+        delete_many_from_cache(pairs_list)
+
+
+@contextmanager
+def permission_memo():
+    """
+    Context manager which enables a memo layer in
+    front of the cache system for the current thread.
+    Repeated checks inside the block cost a single
+    dictionary lookup.
+
+    The memo is cleared whenever the roles or the
+    permissions change.
+    """
+    if get_memo() is not None:
+        # Already enabled.
+        yield
+        return
+
+    MEMO.data = dict()
+    try:
+        yield
+    finally:
+        MEMO.data = None
+
+
+def get_memo():
+    """
+    Return the dictionary of the memo layer or
+    None if it is not enabled in this thread.
     """
-    key = generate_cache_key(user, obj, any_object=False)
-    dip_cache().delete(key)
+    return getattr(MEMO, 'data', None)
 
-    key = generate_cache_key(user, obj=None, any_object=True)
-    dip_cache().delete(key)
 
+def clear_memo():
+    """
+    Erase all data of the memo layer.
+    """
+    memo = get_memo()
+    if memo is not None:
+        memo.clear()
 
-def get_from_cache(user, obj, any_object):
+
+def get_from_cache(user, obj, any_object, generations=None):
     """
     Get all permissions data about
     the user and the object passed
     via arguments e store it in
     the Django cache system.
+
+    The object can be a model instance
+    or its key from "get_object_key". The
+    dictionary "generations" can be used
+    to share the generations between calls.
     """
-    from django.contrib.contenttypes.models import ContentType
     from improved_permissions.models import UserRole
 
+    # Checking the memo layer.
+    memo = get_memo()
+    if memo is not None:
+        memo_key = get_memo_key(user, obj, any_object)
+        if memo_key in memo:
+            return memo[memo_key]
+
+    # Checking the profile of the user.
+    profile = get_profile(user, generations)
+    if profile is not None:
+        data = get_profile_data(profile, obj, any_object)
+        if memo is not None:
+            memo[memo_key] = data
+        return data
+
     # Key preparation.
-    key = generate_cache_key(user, obj, any_object)
+    key = generate_cache_key(user, obj, any_object, generations)
 
     # Check for the cached data.
     data = dip_cache().get(key)
@@ -327,35 +996,314 @@ def get_from_cache(user, obj, any_object):
 
         # Filtering by object.
         if obj:
-            ct_obj = ContentType.objects.get_for_model(obj)
-            query = query.filter(content_type=ct_obj.id).filter(object_id=obj.id)
+            ct_id, obj_id = get_object_key(obj)
+            query = query.filter(content_type=ct_id).filter(object_id=obj_id)
         elif not any_object:
             query = query.filter(content_type__isnull=True).filter(object_id__isnull=True)
 
         # Getting only the required values.
         query = query.values_list(
+            'id',
             'role_class',
             'accesses__permission',
             'accesses__access'
-        )
+        ).order_by('id')
 
         # Transform the query result into
-        # a dictionary.
-        data = dict()
-        for item in query:
-            perms_list = data.get(item[0], [])
-            if item[0] and item[1]:
-                perms_list.append((item[1], item[2]))
-            data[item[0]] = perms_list
-
-        # Ordering the tuple by their Role Ranking values.
-        data = sorted(data.items(), key=lambda role: get_roleclass(role[0]).ranking)
-
-        # Now, we get only the data from the
-        # first role class found.
-        data = data[0] if data else ()
+        # the cached data format.
+        data = get_role_data(query)
 
         # Set the data to the cache.
         dip_cache().set(key, data)
 
+    if memo is not None:
+        memo[memo_key] = data
+    return data
+
+
+def get_memo_key(user, obj, any_object):
+    """
+    Return the key used in the memo layer for the
+    user and the object passed via arguments.
+    """
+    obj_key = get_object_key(obj) if obj else None
+    return ('userrole', user.__class__, user.pk, obj_key, any_object)
+
+
+def get_profile_key(user, generations=None):
+    """
+    Return the cache key of the profile of
+    the user, based on its current generation.
+    """
+    if generations is None:
+        generations = dict()
+
+    user_key = get_object_key(user)
+    if user_key not in generations:
+        generations.update(get_generations([user_key]))
+
+    prefix = get_config('CACHE_PREFIX_KEY', CACHE_KEY_PREFIX)
+    return '{}-profile-{}-{}.{}'.format(prefix, user_key[0], user_key[1], generations[user_key])
+
+
+def get_profile(user, generations=None):
+    """
+    Return the profile of the user: a dictionary
+    mapping the key of each object to the data of
+    "get_role_data". The roles without an object
+    use the key None and the best role among all
+    of them uses the key "any".
+
+    All roles and permissions of the user are loaded
+    with a single query. Return None if the profile
+    mode is disabled or if the user has more roles
+    than the "PROFILE_MAX_ROLES" setting.
+
+    The profile follows the generation of the user,
+    so "invalidate_user_cache" also discards it.
+    """
+    from improved_permissions.models import UserRole
+
+    if not get_config('PROFILE', False):
+        return None
+
+    # Checking the memo layer.
+    memo = get_memo()
+    memo_key = ('profile', user.__class__, user.pk)
+    if memo is not None and memo_key in memo:
+        return memo[memo_key]
+
+    key = get_profile_key(user, generations)
+    profile = dip_cache().get(key)
+    if profile is None:
+        max_roles = get_config('PROFILE_MAX_ROLES', 1000)
+        query = (UserRole.objects
+                 .filter(user=user)
+                 .values_list('id', 'content_type', 'object_id', 'role_class',
+                              'accesses__permission', 'accesses__access')
+                 .order_by('id'))
+
+        # Splitting the rows by object.
+        rows = dict()
+        roles = set()
+        for item in query.iterator():
+            roles.add(item[0])
+            if len(roles) > max_roles:
+                # Too many roles, so the
+                # checks load each object.
+                rows = None
+                break
+            obj_key = (item[1], item[2]) if item[1] else None
+            rows.setdefault(obj_key, []).append((item[0],) + item[3:])
+
+        if rows is None:
+            profile = False
+        else:
+            profile = {obj_key: get_role_data(items) for obj_key, items in rows.items()}
+            profile['any'] = get_role_data([item for items in rows.values() for item in items])
+
+        # The value False means that the
+        # user does not have a profile.
+        dip_cache().set(key, profile)
+
+    profile = profile or None
+    if memo is not None:
+        memo[memo_key] = profile
+    return profile
+
+
+def get_profile_data(profile, obj, any_object):
+    """
+    Return the data of "get_role_data" about
+    the object passed via argument using the
+    profile of the user.
+    """
+    if obj:
+        return profile.get(get_object_key(obj), ())
+    if any_object:
+        return profile['any']
+    return profile.get(None, ())
+
+
+def get_role_data(rows):
+    """
+    Transform the rows of (id, role_class, permission,
+    access) into the data stored in the cache: the
+    role class with the best ranking and the list
+    of its (permission, access) tuples.
+    """
+    from improved_permissions.roles import RoleManager
+
+    data = dict()
+    first_ids = dict()
+    for item in rows:
+        perms_list = data.get(item[1], [])
+        if item[1] and item[2]:
+            perms_list.append((item[2], item[3]))
+        data[item[1]] = perms_list
+        first_ids[item[1]] = min(item[0], first_ids.get(item[1], item[0]))
+
+    # Ordering the tuple by their Role Ranking values.
+    # Ties are broken by the lowest UserRole id, the
+    # same way "filter_queryset" does.
+    data = sorted(data.items(), key=lambda role: (RoleManager.get_policy(role[0]).ranking,
+                                                  first_ids[role[0]]))
+
+    # Now, we get only the data from the
+    # first role class found.
+    return data[0] if data else ()
+
+
+def load_parents(objs_list):
+    """
+    Walk through the "permission_parents" of all
+    instances in "objs_list" level by level,
+    prefetching the relations of each level with
+    a single query per model and field.
+
+    Return the list of all instances found,
+    including the ones in "objs_list".
+    """
+    from django.core.exceptions import FieldDoesNotExist
+    from django.db.models import prefetch_related_objects
+
+    max_depth = get_config('MAX_PARENTS_DEPTH', None)
+
+    result = list()
+    visited = set()
+    depth = 0
+    level = [obj for obj in objs_list if obj is not None]
+    while level:
+        level = [obj for obj in level if get_object_key(obj) not in visited]
+        visited.update(get_object_key(obj) for obj in level)
+        result.extend(level)
+
+        # Checking the maximum depth.
+        if max_depth is not None and depth >= max_depth:
+            break
+        depth += 1
+
+        # Grouping the instances by their
+        # model in order to prefetch them.
+        grouped = dict()
+        for obj in level:
+            grouped.setdefault(obj.__class__, []).append(obj)
+
+        for model, instances in grouped.items():
+            fields = list()
+            options = getattr(model, 'RoleOptions', None)
+            for parent in getattr(options, 'permission_parents', None) or []:
+                try:
+                    field = model._meta.get_field(parent)  # pylint: disable=protected-access
+                except FieldDoesNotExist:
+                    continue
+                if not (field.many_to_one or field.one_to_one):
+                    continue
+
+                # Skipping relations which are null
+                # for all instances of this level.
+                attname = getattr(field, 'attname', None)
+                if attname and all(getattr(obj, attname) is None for obj in instances):
+                    continue
+                fields.append(parent)
+            if fields:
+                prefetch_related_objects(instances, *fields)
+
+        # The relations are already loaded,
+        # so get_parents does not hit the
+        # database anymore.
+        next_level = list()
+        for obj in level:
+            next_level.extend(get_parents(obj))
+        level = next_level
+
+    return result
+
+
+def get_many_from_cache(user, keys_list):
+    """
+    Same as "get_from_cache", but for a list of
+    object keys at once. Use a single "get_many"
+    in the cache system and a single query for
+    all objects not found in it.
+
+    Return a dictionary mapping the key of
+    each object to their data.
+    """
+    from django.db.models import Q
+    from improved_permissions.models import UserRole
+
+    # Checking the memo layer.
+    result = dict()
+    memo = get_memo()
+    if memo is not None:
+        for obj_key in keys_list:
+            memo_key = get_memo_key(user, obj_key, any_object=False)
+            if memo_key in memo:
+                result[obj_key] = memo[memo_key]
+
+    keys_list = [obj_key for obj_key in keys_list if obj_key not in result]
+
+    # Checking the profile of the user.
+    profile = get_profile(user)
+    if profile is not None:
+        for obj_key in keys_list:
+            result[obj_key] = get_profile_data(profile, obj_key, any_object=False)
+        return update_memo(user, result)
+
+    generations = get_generations([user] + keys_list)
+
+    cache_keys = dict()
+    for obj_key in keys_list:
+        key = generate_cache_key(user, obj_key, any_object=False, generations=generations)
+        cache_keys[key] = obj_key
+
+    cached = dip_cache().get_many(list(cache_keys)) if cache_keys else dict()
+    result.update({cache_keys[key]: value for key, value in cached.items()})
+    missing = [key for key in cache_keys if key not in cached]
+    if not missing:
+        return update_memo(user, result)
+
+    # Grouping the missing objects by
+    # their content type.
+    grouped = dict()
+    for key in missing:
+        ct_id, obj_id = cache_keys[key]
+        grouped.setdefault(ct_id, dict())[obj_id] = key
+
+    condition = Q()
+    for ct_id, ids_dict in grouped.items():
+        condition |= Q(content_type=ct_id, object_id__in=list(ids_dict))
+
+    query = (UserRole.objects
+             .filter(condition, user=user)
+             .values_list('content_type', 'object_id', 'id', 'role_class',
+                          'accesses__permission', 'accesses__access')
+             .order_by('id'))
+
+    # Splitting the rows by object.
+    rows = dict()
+    for item in query:
+        rows.setdefault((item[0], item[1]), []).append(item[2:])
+
+    data = dict()
+    for ct_id, ids_dict in grouped.items():
+        for obj_id, key in ids_dict.items():
+            data[key] = get_role_data(rows.get((ct_id, obj_id), []))
+            result[(ct_id, obj_id)] = data[key]
+
+    # Set all data to the cache at once.
+    dip_cache().set_many(data)
+    return update_memo(user, result)
+
+
+def update_memo(user, data):
+    """
+    Store the data of "get_many_from_cache"
+    into the memo layer, if enabled.
+    """
+    memo = get_memo()
+    if memo is not None:
+        for obj_key, value in data.items():
+            memo[get_memo_key(user, obj_key, any_object=False)] = value
     return data
@@ -14,6 +14,8 @@ setup(
     version='0.2.2',
     packages=[
         'improved_permissions',
+        'improved_permissions.management',
+        'improved_permissions.management.commands',
         'improved_permissions.migrations',
         'improved_permissions.templatetags',
     ],
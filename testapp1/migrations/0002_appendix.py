@@ -0,0 +1,25 @@
+# Generated by Django 2.0.13 on 2026-10-18 01:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testapp1', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Appendix',
+            fields=[
+                ('chapter_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='testapp1.Chapter')),
+                ('pages', models.PositiveIntegerField(default=1)),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=('testapp1.chapter',),
+        ),
+    ]
@@ -42,6 +42,11 @@ class Chapter(RoleMixin, models.Model):
         permission_parents = ['book', 'cited_by']
 
 
+class Appendix(Chapter):
+    """ Appendix test model, using multi-table inheritance """
+    pages = models.PositiveIntegerField(default=1)
+
+
 class Paragraph(RoleMixin, models.Model):
     chapter = models.ForeignKey(Chapter, on_delete=models.CASCADE)
     content = models.TextField()
@@ -53,6 +58,15 @@ class Paragraph(RoleMixin, models.Model):
         permission_parents = ['chapter']
 
 
+class Section(RoleMixin, models.Model):
+    """ Section test model, using recursive parents """
+    title = models.CharField(max_length=256)
+    parent = models.ForeignKey('self', blank=True, null=True, on_delete=models.SET_NULL)
+
+    class RoleOptions:
+        permission_parents = ['parent']
+
+
 class UniqueTogether(RoleMixin, models.Model):
     content = models.TextField()
 
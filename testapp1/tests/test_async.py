@@ -0,0 +1,103 @@
+""" async shortcuts tests """
+import asyncio
+
+from django.core.exceptions import PermissionDenied
+from django.test import TransactionTestCase
+
+from improved_permissions import async_shortcuts, shortcuts
+from improved_permissions.async_shortcuts import (aassign_role,
+                                                  abulk_assign_roles,
+                                                  aget_objects,
+                                                  aget_objects_page,
+                                                  aget_user_ids, aget_users,
+                                                  aget_users_page,
+                                                  ahas_permission,
+                                                  ahas_permission_many,
+                                                  ahas_permissions, ahas_role,
+                                                  aremove_role)
+from improved_permissions.mixins import AsyncPermissionMixin
+from improved_permissions.roles import RoleManager
+from improved_permissions.utils import dip_cache
+from testapp1.models import MyUser
+from testapp1.roles import Advisor
+
+
+class Request(object):
+    user = None
+
+
+class Dispatch(object):
+    async def dispatch(self, request, *args, **kwargs):
+        return 'Protected View'
+
+
+class AsyncView(AsyncPermissionMixin, Dispatch):
+    permission_string = 'testapp1.change_user'
+
+    def __init__(self, user, obj):
+        self.request = Request()
+        self.request.user = user
+        self.permission_object = obj
+
+
+class AsyncTest(TransactionTestCase):
+    """ async shortcuts tests """
+
+    def setUp(self):
+        RoleManager.cleanup()
+        RoleManager.register_role(Advisor)
+
+        self.john = MyUser.objects.create(username='john')
+        self.bob = MyUser.objects.create(username='bob')
+        self.mike = MyUser.objects.create(username='mike')
+        dip_cache().clear()
+
+    def run_async(self, coroutine):
+        return asyncio.get_event_loop().run_until_complete(coroutine)
+
+    def test_shortcuts(self):
+        """ test if the async shortcuts work like the sync ones """
+        self.assertFalse(self.run_async(ahas_role(self.john, Advisor, self.bob)))
+
+        self.run_async(aassign_role(self.john, Advisor, self.bob))
+        self.assertTrue(self.run_async(ahas_role(self.john, Advisor, self.bob)))
+        self.assertTrue(self.run_async(ahas_permission(self.john, 'testapp1.change_user', self.bob)))
+        self.assertEqual(self.run_async(aget_users(Advisor, self.bob)), [self.john])
+        self.assertEqual(self.run_async(aget_objects(self.john, Advisor)), [self.bob])
+
+        objs_list = [self.bob, self.mike]
+        result = self.run_async(ahas_permissions(self.john, 'testapp1.change_user', objs_list))
+        self.assertEqual(result, {self.bob.pk: True, self.mike.pk: False})
+
+        result = self.run_async(ahas_permission_many(self.john, 'testapp1.change_user', objs_list))
+        self.assertEqual(result, [True, False])
+
+        self.run_async(aremove_role(self.john, Advisor, self.bob))
+        self.assertFalse(self.run_async(ahas_permission(self.john, 'testapp1.change_user', self.bob)))
+
+        # Bulk assignment and pages.
+        self.run_async(abulk_assign_roles([self.john], Advisor, [self.bob, self.mike]))
+        self.assertEqual(self.run_async(aget_user_ids(Advisor, self.mike)), [self.john.pk])
+        self.assertEqual(self.run_async(aget_users_page(Advisor, self.mike, limit=1)), ([self.john], None))
+        objs_list, cursor = self.run_async(aget_objects_page(self.john, Advisor, limit=1))
+        self.assertEqual(objs_list, [self.bob])
+        self.assertIsNotNone(cursor)
+
+    def test_counterparts(self):
+        """ test if the shortcuts have their async counterparts """
+        lazy_list = ['iter_users', 'iter_objects', 'get_objects_querysets']
+        names = [name for name, value in vars(shortcuts).items()
+                 if callable(value) and getattr(value, '__module__', None) == shortcuts.__name__]
+        for name in names:
+            self.assertEqual(hasattr(async_shortcuts, 'a' + name), name not in lazy_list, name)
+
+    def test_async_mixin(self):
+        """ test if the async mixin protects the view """
+        self.run_async(aassign_role(self.john, Advisor, self.bob))
+
+        view = AsyncView(self.john, self.bob)
+        self.assertEqual(self.run_async(view.dispatch(view.request)), 'Protected View')
+
+        view = AsyncView(self.john, self.mike)
+        with self.assertRaises(PermissionDenied):
+            self.run_async(view.dispatch(view.request))
@@ -0,0 +1,213 @@
+""" local cache tests """
+from unittest import mock
+
+from django.test import TestCase
+
+from improved_permissions.cache import LocalCache, LocalOptions
+from improved_permissions.models import UserRole
+from improved_permissions.roles import RoleManager
+from improved_permissions.shortcuts import (assign_permission, assign_role,
+                                            has_permission, remove_role)
+from improved_permissions.utils import (dip_cache, flush_cleanup,
+                                        generate_cache_key,
+                                        get_generation_key, get_object_key,
+                                        get_profile,
+                                        invalidate_object_cache,
+                                        invalidate_user_cache)
+from testapp1.models import MyUser
+from testapp1.roles import Advisor, Coordenator
+
+LOCAL_SETTINGS = {
+    'LOCAL_CACHE_SIZE': 2,
+    'LOCAL_CACHE_TIMEOUT': 5,
+    'LOCAL_CACHE_INTERVAL': 60,
+}
+
+
+class LocalCacheTest(TestCase):
+    """ local cache tests """
+
+    def setUp(self):
+        RoleManager.cleanup()
+        RoleManager.register_role(Advisor)
+
+        self.john = MyUser.objects.create(username='john')
+        self.bob = MyUser.objects.create(username='bob')
+        dip_cache().clear()
+
+    def test_local_cache(self):
+        """ test the LRU, the timeout and the version stamp """
+        with self.settings(IMPROVED_PERMISSIONS_SETTINGS=LOCAL_SETTINGS):
+            cache = dip_cache()
+            self.assertIsInstance(cache, LocalCache)
+            self.assertIs(dip_cache(), cache)
+            cache.clear()
+
+            # Another process using the same shared cache.
+            other = LocalCache('default', 'dip', LocalOptions(2, 5, 60))
+
+            cache.set('a', 1)
+            self.assertEqual(other.get('a'), 1)
+            self.assertEqual(cache.shared.get('a'), 1)
+
+            # The local entry is used until the version is checked again.
+            cache.delete('a')
+            self.assertEqual(other.get('a'), 1)
+            other.checked_at = None
+            self.assertEqual(other.get('a'), None)
+
+            # Least recently used entries are evicted.
+            cache.set_many({'a': 1, 'b': 2})
+            self.assertEqual(cache.get('a'), 1)
+            cache.set('c', 3)
+            self.assertEqual(list(cache.entries), ['a', 'c'])
+            self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2, 'c': 3})
+
+            # Local entries expire after the timeout.
+            cache.set('d', 4)
+            with mock.patch.object(cache.shared, 'get', return_value=None):
+                self.assertEqual(cache.get('d'), 4)
+                cache.checked_at = 10 ** 10
+                with mock.patch('improved_permissions.cache.time.monotonic', return_value=10 ** 10):
+                    self.assertEqual(cache.get('d'), None)
+                self.assertNotIn('d', cache.entries)
+
+    def test_permissions(self):
+        """ test if the permission checks work using the local cache """
+        with self.settings(IMPROVED_PERMISSIONS_SETTINGS=LOCAL_SETTINGS):
+            self.assertFalse(has_permission(self.john, 'testapp1.change_user', self.bob))
+            assign_role(self.john, Advisor, self.bob)
+            self.assertTrue(has_permission(self.john, 'testapp1.change_user', self.bob))
+
+            with self.assertNumQueries(0):
+                self.assertTrue(has_permission(self.john, 'testapp1.change_user', self.bob))
+
+            remove_role(self.john, Advisor, self.bob)
+            self.assertFalse(has_permission(self.john, 'testapp1.change_user', self.bob))
+
+
+class GenerationsTest(TestCase):
+    """ cache generations tests """
+
+    def setUp(self):
+        RoleManager.cleanup()
+        RoleManager.register_role(Advisor)
+
+        self.john = MyUser.objects.create(username='john')
+        self.bob = MyUser.objects.create(username='bob')
+        dip_cache().clear()
+
+    def create_role(self, user, obj):
+        """ create a role without touching the cache """
+        UserRole(user=user, role_class=Advisor.get_class_name(), obj=obj).save()
+
+    def test_generations(self):
+        """ test if all keys of a user or an object are invalidated at once """
+        self.assertFalse(has_permission(self.john, 'testapp1.change_user', self.bob))
+
+        self.create_role(self.john, self.bob)
+        self.assertFalse(has_permission(self.john, 'testapp1.change_user', self.bob))
+
+        # Invalidating everything about "bob".
+        invalidate_object_cache(self.bob)
+        self.assertTrue(has_permission(self.john, 'testapp1.change_user', self.bob))
+
+        # Invalidating everything about "john".
+        UserRole.objects.all().delete()
+        self.assertTrue(has_permission(self.john, 'testapp1.change_user', self.bob))
+        invalidate_user_cache(self.john)
+        self.assertFalse(has_permission(self.john, 'testapp1.change_user', self.bob))
+
+        # The keys do not depend on the string representation.
+        old_key = generate_cache_key(self.john, self.bob, False)
+        self.bob.username = 'robert'
+        self.assertEqual(generate_cache_key(self.john, self.bob, False), old_key)
+
+        # A lost generation counter never reuses old keys.
+        dip_cache().delete(get_generation_key(self.bob))
+        self.assertNotEqual(generate_cache_key(self.john, self.bob, False), old_key)
+
+    def test_generations_wiring(self):
+        """ test if the assignments and the deletions bump the generations """
+        self.assertFalse(has_permission(self.john, 'testapp1.change_user', self.bob))
+        john_key = generate_cache_key(self.john, None, True)
+
+        # Assigning a role discards the generation of the user.
+        assign_role(self.john, Advisor, self.bob)
+        self.assertNotEqual(generate_cache_key(self.john, None, True), john_key)
+        self.assertTrue(has_permission(self.john, 'testapp1.change_user', self.bob))
+
+        # Deleting an object discards its generation.
+        bob_key = get_generation_key(self.bob)
+        self.assertIsNotNone(dip_cache().get(bob_key))
+        flush_cleanup([get_object_key(self.bob)], 'default')
+        self.assertIsNone(dip_cache().get(bob_key))
+        self.assertFalse(has_permission(self.john, 'testapp1.change_user', self.bob))
+
+    def test_generations_timeout(self):
+        """ test if the counters expire along with the data """
+        cache = dip_cache()
+        with mock.patch.object(cache, 'add', wraps=cache.add) as add:
+            generate_cache_key(self.john, self.bob, False)
+        self.assertEqual(add.call_count, 2)
+        for call in add.call_args_list:
+            self.assertEqual(len(call[0]), 2)
+            self.assertEqual(call[1], {})
+
+
+class ProfileTest(TestCase):
+    """ permission profile tests """
+
+    def setUp(self):
+        RoleManager.cleanup()
+        RoleManager.register_role(Advisor)
+        RoleManager.register_role(Coordenator)
+
+        self.john = MyUser.objects.create(username='john')
+        self.users = [MyUser.objects.create(username='user%d' % i) for i in range(5)]
+        dip_cache().clear()
+
+    def test_profile(self):
+        """ test if all roles of the user are loaded with a single query """
+        for user in self.users[:3]:
+            assign_role(self.john, Advisor, user)
+        assign_permission(self.john, Advisor, 'testapp1.change_user', False, self.users[2])
+
+        with self.settings(IMPROVED_PERMISSIONS_SETTINGS={'PROFILE': True}):
+            # Warming up the permission lookup.
+            dip_cache().clear()
+            has_permission(self.users[0], 'testapp1.change_user')
+
+            with self.assertNumQueries(1):
+                for user in self.users:
+                    has_permission(self.john, 'testapp1.change_user', user)
+                has_permission(self.john, 'testapp1.change_user', any_object=True)
+
+            with self.assertNumQueries(0):
+                result = [has_permission(self.john, 'testapp1.change_user', user)
+                          for user in self.users]
+                self.assertEqual(result, [True, True, False, False, False])
+                self.assertTrue(has_permission(self.john, 'testapp1.change_user', any_object=True))
+                self.assertFalse(has_permission(self.john, 'testapp1.change_user'))
+
+            # Changing the roles discards the profile.
+            assign_role(self.john, Coordenator)
+            remove_role(self.john, Advisor, self.users[0])
+            self.assertFalse(has_permission(self.john, 'testapp1.change_user', self.users[0]))
+            self.assertTrue(has_permission(self.john, 'testapp1.delete_user', self.users[3]))
+
+    def test_profile_max_roles(self):
+        """ test if users with too many roles load each object """
+        for user in self.users:
+            assign_role(self.john, Advisor, user)
+
+        new_settings = {'PROFILE': True, 'PROFILE_MAX_ROLES': 2}
+        with self.settings(IMPROVED_PERMISSIONS_SETTINGS=new_settings):
+            dip_cache().clear()
+            has_permission(self.users[0], 'testapp1.change_user')
+            self.assertIsNone(get_profile(self.john))
+
+            with self.assertNumQueries(len(self.users)):
+                for user in self.users:
+                    self.assertTrue(has_permission(self.john, 'testapp1.change_user', user))
+                self.assertIsNone(get_profile(self.john))
@@ -0,0 +1,68 @@
+""" memo layer tests """
+from unittest import mock
+
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+
+from improved_permissions.middleware import PermissionMemoMiddleware
+from improved_permissions.roles import RoleManager
+from improved_permissions.shortcuts import (assign_permission, assign_role,
+                                            has_permission, remove_role)
+from improved_permissions.utils import dip_cache, get_memo, permission_memo
+from testapp1.models import MyUser
+from testapp1.roles import Advisor
+
+
+class MemoTest(TestCase):
+    """ memo layer tests """
+
+    def setUp(self):
+        RoleManager.cleanup()
+        RoleManager.register_role(Advisor)
+
+        self.john = MyUser.objects.create(username='john')
+        self.bob = MyUser.objects.create(username='bob')
+        dip_cache().clear()
+
+    def test_permission_memo(self):
+        """ test if repeated checks do not hit the cache """
+        assign_role(self.john, Advisor, self.bob)
+        cache = dip_cache()
+
+        with permission_memo():
+            self.assertTrue(has_permission(self.john, 'testapp1.change_user', self.bob))
+            self.assertFalse(has_permission(self.bob, 'testapp1.change_user', self.john))
+
+            with mock.patch.object(cache, 'get', wraps=cache.get) as cache_get:
+                with self.assertNumQueries(0):
+                    for dummy in range(20):
+                        self.assertTrue(has_permission(self.john, 'testapp1.change_user', self.bob))
+                        self.assertFalse(has_permission(self.bob, 'testapp1.change_user', self.john))
+            self.assertEqual(cache_get.call_count, 0)
+
+            # Changing the roles clears the memo.
+            assign_permission(self.john, Advisor, 'testapp1.change_user', False, self.bob)
+            self.assertFalse(has_permission(self.john, 'testapp1.change_user', self.bob))
+
+            remove_role(self.john, Advisor, self.bob)
+            assign_role(self.bob, Advisor, self.john)
+            self.assertTrue(has_permission(self.bob, 'testapp1.change_user', self.john))
+
+            # Nested blocks share the same memo.
+            memo = get_memo()
+            with permission_memo():
+                self.assertIs(get_memo(), memo)
+
+        # The memo only lives inside the block.
+        self.assertIsNone(get_memo())
+
+    def test_middleware(self):
+        """ test if the middleware enables the memo during the request """
+        def view(request):
+            self.assertIsNotNone(get_memo())
+            return HttpResponse('OK')
+
+        middleware = PermissionMemoMiddleware(view)
+        response = middleware(RequestFactory().get('/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(get_memo())
@@ -1,18 +1,42 @@
 """ mixins tests """
+from collections import Counter
+from io import StringIO
+from unittest import mock
+
 from django.test import TestCase
 
 from improved_permissions.exceptions import NotAllowed
 from improved_permissions.models import RolePermission
 from improved_permissions.roles import ALL_MODELS, Role, RoleManager
-from improved_permissions.shortcuts import get_users
+from improved_permissions.shortcuts import (assign_permission, bulk_assign_roles,
+                                            get_objects_page, get_objects_querysets,
+                                            get_roles_page, get_users,
+                                            get_users_page, iter_objects,
+                                            iter_users)
 from improved_permissions.templatetags.roletags import has_perm as tg_has_perm
-from improved_permissions.utils import dip_cache
+from improved_permissions.utils import dip_cache, get_object_key
 from testapp1.models import Book, Chapter, MyUser, Paragraph
 from testapp1.roles import Advisor, Author, Coordenator, Reviewer
 from testapp2.models import Library
 from testapp2.roles import LibraryOwner, LibraryWorker
 
 
+class CountingCache(object):
+    """ cache proxy counting the calls of each method """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.calls = Counter()
+
+    def __getattr__(self, name):
+        method = getattr(self.cache, name)
+
+        def wrapper(*args, **kwargs):
+            self.calls[name] += 1
+            return method(*args, **kwargs)
+        return wrapper
+
+
 class MixinsTest(TestCase):
     """ mixins test class """
 
@@ -157,7 +181,8 @@ class MixinsTest(TestCase):
         # Get all users with who is Author of "book".
         self.book.assign_role(self.john, Author)
         result = self.book.get_users(Author)
-        self.assertEqual(list(result), [self.bob, self.john])
+        self.assertCountEqual(result, [self.bob, self.john])
+        self.assertCountEqual(self.book.get_user_ids(Author), [self.bob.id, self.john.id])
 
         # Trying to use the reverse GerericRelation.
         reverse = list(self.book.roles.values_list('user', flat=True))
@@ -244,8 +269,285 @@ class MixinsTest(TestCase):
 
         # Get all objects of john for any Role.
         result = self.john.get_objects()
-        self.assertEqual(result, [self.library, self.bob])
+        self.assertCountEqual(result, [self.library, self.bob])
 
         # Get all objects of john but only of User model.
         result = self.john.get_objects(model=MyUser)
         self.assertEqual(result, [self.bob])
+
+    def test_get_objects_querysets(self):
+        """ test if the objects are fetched using one query per model """
+        chapters_list = [Chapter.objects.create(title='Chapter %d' % i, book=self.book) for i in range(30)]
+        bulk_assign_roles([self.john], Author, chapters_list)
+        self.john.assign_role(Advisor, self.bob)
+        self.john.assign_role(Coordenator)
+
+        # One query for the models and
+        # one query for each model.
+        with self.assertNumQueries(3):
+            result = self.john.get_objects()
+        self.assertCountEqual(result, chapters_list + [self.bob])
+
+        # The QuerySets can be filtered further.
+        querysets = get_objects_querysets(self.john)
+        self.assertCountEqual(querysets.keys(), [Chapter, MyUser])
+        self.assertEqual(querysets[Chapter].filter(title='Chapter 0').get(), chapters_list[0])
+
+        result = iter_objects(self.john, Author, chunk_size=10)
+        self.assertEqual(sorted(obj.pk for obj in result), [obj.pk for obj in chapters_list])
+
+    def test_pagination(self):
+        """ test if the keyset pages cover all items with a constant cost """
+        chapters_list = [Chapter.objects.create(title='Chapter %d' % i, book=self.book) for i in range(25)]
+        users_list = [MyUser.objects.create(username='user%d' % i) for i in range(25)]
+        bulk_assign_roles([self.john], Author, chapters_list)
+        bulk_assign_roles(users_list, Author, [self.book])
+        self.john.assign_role(Advisor, self.bob)
+
+        # An object with two roles is found once.
+        self.book.assign_role(self.john, Author)
+        self.book.assign_role(self.john, Reviewer)
+        expected = sorted(chapters_list + [self.bob, self.book], key=get_object_key)
+
+        # One query for the keys and one for each
+        # model, however deep the page is.
+        result = list()
+        cursor = None
+        for index in range(0, len(expected), 10):
+            models_set = set(obj.__class__ for obj in expected[index:index + 10])
+            with self.assertNumQueries(1 + len(models_set)):
+                page, cursor = get_objects_page(self.john, cursor=cursor, limit=10)
+            self.assertEqual(page, expected[index:index + 10])
+            result.extend(page)
+        self.assertIsNone(cursor)
+        self.assertEqual(result, expected)
+
+        # The objects which no longer exist are left out.
+        Chapter.objects.filter(pk=chapters_list[0].pk)._raw_delete('default')
+        first_page, cursor = get_objects_page(self.john, Author, limit=2)
+        self.assertEqual(len(first_page), 1)
+        self.assertIsNotNone(cursor)
+        page, cursor = get_objects_page(self.john, Author, cursor=cursor, limit=25)
+        self.assertIsNone(cursor)
+        self.assertEqual(first_page + page, sorted([self.book] + chapters_list[1:], key=get_object_key))
+        self.book.remove_role(self.john)
+
+        # The users of the book.
+        page, cursor = get_users_page(Author, self.book, limit=10)
+        self.assertEqual(page, users_list[:10])
+        with self.assertNumQueries(1):
+            page, cursor = get_users_page(Author, self.book, cursor=cursor, limit=10)
+        self.assertEqual(page, users_list[10:20])
+        self.assertEqual(list(iter_users(Author, self.book, chunk_size=7)), users_list)
+
+        # The roles of john.
+        page, cursor = get_roles_page(self.john, limit=25)
+        self.assertEqual(page, [Author] * 25)
+        self.assertEqual(get_roles_page(self.john, cursor=cursor), ([Advisor], None))
+
+    def test_has_permissions(self):
+        """ test if the batch has_permissions works like has_permission """
+        self.library.assign_role(self.john, LibraryOwner)
+        self.book.assign_role(self.bob, Author)
+        self.book.assign_role(self.mike, Reviewer)
+        self.mike.assign_role(Coordenator)
+
+        objs_list = [self.library, self.book, self.another_book, self.chapter, self.paragraph]
+        perms_list = ['testapp1.add_book', 'testapp1.review', 'testapp1.change_user']
+        for user in [self.john, self.bob, self.mike]:
+            for perm in perms_list:
+                for persistent in [False, True]:
+                    dip_cache().clear()
+                    result = user.has_permissions(perm, objs_list, persistent=persistent)
+                    expected = {obj.pk: user.has_permission(perm, obj, persistent=persistent)
+                                for obj in objs_list}
+                    self.assertEqual(result, expected)
+
+        # The number of queries does not depend on the number of objects.
+        chapters = [Chapter.objects.create(title='Chapter', book=self.book) for _ in range(10)]
+        paragraphs = [Paragraph.objects.create(content='Text', chapter=chapter) for chapter in chapters]
+        objs_list = list(Paragraph.objects.filter(pk__in=[p.pk for p in paragraphs]))
+
+        dip_cache().clear()
+        with self.assertNumQueries(3):
+            result = self.bob.has_permissions('testapp1.add_paragraph', objs_list)
+        self.assertTrue(all(result.values()))
+        self.assertEqual(self.bob.has_permissions('testapp1.add_paragraph', []), {})
+
+    def test_filter_queryset(self):
+        """ test if filter_queryset works like has_permission """
+        other_library = Library.objects.create(title='Other Library')
+        other_book = Book.objects.create(title='Other Book', library=other_library)
+        Chapter.objects.create(title='Cited', book=other_book, cited_by=self.book)
+        Chapter.objects.create(title='Other', book=other_book)
+        Paragraph.objects.create(content='Other', chapter=Chapter.objects.last())
+
+        self.library.assign_role(self.john, LibraryOwner)
+        self.book.assign_role(self.bob, Author)
+        self.book.assign_role(self.mike, Reviewer)
+        self.mike.assign_role(Coordenator)
+        self.mike.assign_role(LibraryWorker, other_library)
+        self.john.assign_role(Author, other_book)
+        assign_permission(self.john, Author, 'testapp1.add_book', False, other_book)
+
+        perms_list = ['testapp1.add_book', 'testapp1.change_book', 'testapp1.review', 'testapp1.change_user']
+        for model in [Library, Book, Chapter, Paragraph]:
+            for user in [self.john, self.bob, self.mike]:
+                for perm in perms_list:
+                    for persistent in [False, True]:
+                        result = user.filter_queryset(perm, model.objects.all(), persistent=persistent)
+                        expected = [obj for obj in model.objects.all()
+                                    if user.has_permission(perm, obj, persistent=persistent)]
+                        self.assertEqual(list(result.order_by('pk')), expected)
+
+        # The result is still a QuerySet.
+        result = self.bob.filter_queryset('testapp1.add_chapter', Chapter.objects.all())
+        self.assertEqual(result.filter(title='Very Nice Chapter 1').count(), 1)
+
+    def test_filter_queryset_ties(self):
+        """ test if equally ranked roles are picked the same way by all checks """
+        self.book.assign_role(self.bob, Reviewer)
+        self.book.assign_role(self.bob, Author)
+        self.book.assign_role(self.mike, Author)
+        self.book.assign_role(self.mike, Reviewer)
+
+        # The oldest role decides.
+        for user, expected in [(self.bob, True), (self.mike, False)]:
+            for settings in [{}, {'PROFILE': True}]:
+                with self.settings(IMPROVED_PERMISSIONS_SETTINGS=settings):
+                    dip_cache().clear()
+                    self.assertEqual(user.has_permission('testapp1.review', self.book), expected)
+                    self.assertEqual(user.has_permissions('testapp1.review', [self.book]),
+                                     {self.book.pk: expected})
+                    result = user.filter_queryset('testapp1.review', Book.objects.filter(pk=self.book.pk))
+                    self.assertEqual(result.exists(), expected)
+
+    def test_get_ancestors(self):
+        """ test if the parents are resolved without loading instances """
+        from django.contrib.contenttypes.models import ContentType
+        from improved_permissions.utils import get_ancestors
+
+        ct_book = ContentType.objects.get_for_model(Book).id
+        ct_chapter = ContentType.objects.get_for_model(Chapter).id
+        ct_library = ContentType.objects.get_for_model(Library).id
+        self.chapter.cited_by = self.another_book
+        self.chapter.save()
+
+        # The direct parents are already in the instance.
+        book = Book.objects.get(pk=self.book.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(list(get_ancestors(book)), [(ct_library, self.library.pk)])
+
+        # All other parents are fetched using a single query.
+        paragraph = Paragraph.objects.get(pk=self.paragraph.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(list(get_ancestors(paragraph)), [
+                (ct_chapter, self.chapter.pk),
+                (ct_book, self.book.pk),
+                (ct_book, self.another_book.pk),
+                (ct_library, self.library.pk),
+            ])
+
+        # The query is only made if needed.
+        self.book.assign_role(self.bob, Author)
+        self.assertTrue(self.bob.has_permission('testapp1.add_paragraph', paragraph))
+        self.paragraph.assign_role(self.mike, Author)
+        dip_cache().clear()
+        with self.assertNumQueries(1):
+            self.assertTrue(self.mike.has_permission('testapp1.add_paragraph', paragraph))
+        cache = CountingCache(dip_cache())
+        with mock.patch('improved_permissions.utils.dip_cache', return_value=cache):
+            with self.assertNumQueries(0):
+                self.assertTrue(self.mike.has_permission('testapp1.add_paragraph', paragraph))
+        self.assertEqual(cache.calls['get_many'], 1)
+        self.assertEqual(cache.calls['get'], 1)
+
+    def test_diamond_parents(self):
+        """ test if each parent is visited only once """
+        self.chapter.cited_by = self.book
+        self.chapter.save()
+        paragraph = Paragraph.objects.get(pk=self.paragraph.pk)
+
+        # Walking through paragraph, chapter, book,
+        # library and ALL_MODELS roles only once.
+        dip_cache().clear()
+        self.mike.has_permission('testapp1.add_paragraph', paragraph)
+        dip_cache().clear()
+        cache = CountingCache(dip_cache())
+        with mock.patch('improved_permissions.utils.dip_cache', return_value=cache):
+            with self.assertNumQueries(6):
+                self.assertFalse(self.mike.has_permission('testapp1.add_paragraph', paragraph, persistent=True))
+        self.assertEqual(cache.calls['get'], 5)
+        self.assertEqual(cache.calls['get_many'], 2)
+        self.assertEqual(cache.calls['set'], 5)
+
+        # The same using the cached data.
+        cache = CountingCache(dip_cache())
+        with mock.patch('improved_permissions.utils.dip_cache', return_value=cache):
+            with self.assertNumQueries(1):
+                self.assertFalse(self.mike.has_permission('testapp1.add_paragraph', paragraph, persistent=True))
+        self.assertEqual(cache.calls['get'], 5)
+        self.assertEqual(cache.calls['get_many'], 2)
+        self.assertEqual(cache.calls['set'], 0)
+
+        # A role on the object itself skips the parents.
+        self.paragraph.assign_role(self.mike, Author)
+        self.assertTrue(self.mike.has_permission('testapp1.add_paragraph', paragraph, persistent=True))
+        with self.assertNumQueries(0):
+            self.assertTrue(self.mike.has_permission('testapp1.add_paragraph', paragraph, persistent=True))
+        self.paragraph.remove_role(self.mike, Author)
+
+        # Limiting the depth of the parents.
+        self.library.assign_role(self.mike, LibraryOwner)
+        self.assertTrue(self.mike.has_permission('testapp1.add_paragraph', paragraph))
+        with self.settings(IMPROVED_PERMISSIONS_SETTINGS={'MAX_PARENTS_DEPTH': 2}):
+            self.assertFalse(self.mike.has_permission('testapp1.add_paragraph', paragraph))
+            self.assertTrue(self.mike.has_permission('testapp1.add_chapter', self.chapter))
+            self.assertEqual(self.mike.has_permissions('testapp1.add_paragraph', [paragraph]),
+                             {paragraph.pk: False})
+            result = self.mike.filter_queryset('testapp1.add_paragraph', Paragraph.objects.all())
+            self.assertEqual(list(result), [])
+
+    def test_sparse_storage(self):
+        """ test if the sparse storage gives the same results """
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+
+        self.library.assign_role(self.john, LibraryOwner)
+        self.book.assign_role(self.bob, Author)
+        self.book.assign_role(self.mike, Reviewer)
+        self.mike.assign_role(Coordenator)
+        self.john.assign_role(Author, self.another_book)
+        assign_permission(self.john, Author, 'testapp1.add_book', False, self.another_book)
+        assign_permission(self.bob, Author, 'testapp1.add_chapter', True, self.book)
+        assign_permission(self.mike, Reviewer, 'testapp1.change_user', True, self.book)
+
+        perms_list = ['testapp1.add_book', 'testapp1.add_chapter', 'testapp1.review',
+                      'testapp1.change_user', 'testapp2.add_library']
+        objs_list = [self.library, self.book, self.another_book, self.chapter, self.paragraph]
+
+        def get_results():
+            dip_cache().clear()
+            results = list()
+            for user in [self.john, self.bob, self.mike]:
+                for perm in perms_list:
+                    results.extend(user.has_permission(perm, obj) for obj in objs_list)
+                    results.append(list(user.filter_queryset(perm, Book.objects.order_by('pk'))))
+            return results
+
+        dense_results = get_results()
+        with self.assertRaises(CommandError):
+            call_command('shrink_role_permissions')
+
+        with self.settings(IMPROVED_PERMISSIONS_SETTINGS={'SPARSE': True}):
+            call_command('shrink_role_permissions', stdout=StringIO())
+
+            # Only the overrides which differ from
+            # the role classes were kept.
+            self.assertEqual(RolePermission.objects.count(), 2)
+            self.assertEqual(get_results(), dense_results)
+
+            # New roles do not store permissions.
+            self.paragraph.assign_role(self.mike, Author)
+            self.assertEqual(RolePermission.objects.count(), 2)
+            self.assertTrue(self.mike.has_permission('testapp1.add_paragraph', self.paragraph))
@@ -1,11 +1,19 @@
 """ models tests """
+from io import StringIO
+
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models.signals import post_delete
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from improved_permissions.models import UserRole
 from improved_permissions.roles import Role, RoleManager
-from testapp1.models import MyUser
-from testapp1.roles import Advisor, Coordenator
+from improved_permissions.utils import cleanup_handler
+from testapp1.models import Appendix, Book, MyUser
+from testapp1.roles import Advisor, Author, Coordenator
+from testapp2.models import Library
 
 
 class ModelsTest(TestCase):
@@ -19,6 +27,13 @@ class ModelsTest(TestCase):
         self.john = MyUser.objects.create(username='john')
         self.bob = MyUser.objects.create(username='bob')
 
+    def run_on_commit(self):
+        """ run the callbacks waiting for the commit of the test transaction """
+        callbacks = [item[1] for item in connection.run_on_commit]
+        connection.run_on_commit = list()
+        for callback in callbacks:
+            callback()
+
     def test_output(self):
         """ check if the str method works fine """
         self.john.assign_role(Advisor, self.bob)
@@ -63,7 +78,105 @@ class ModelsTest(TestCase):
         # Removing the object attached to the UserRole.
         self.bob.delete()
 
+        # The role instances are removed after the commit.
+        self.assertEqual(UserRole.objects.filter(user=self.john).count(), 1)
+        self.run_on_commit()
+
         # Check if the UserRole instance has removed by the signal.
         ur_count = UserRole.objects.filter(user=self.john).count()
         self.assertEqual(ur_count, 0)
         self.assertFalse(self.john.has_permission('testapp1.change_user', self.bob))
+
+    def test_batched_signal(self):
+        """ test if mass deletes remove the role instances at once """
+        users_list = [MyUser.objects.create(username='user%d' % i) for i in range(20)]
+        for user in users_list:
+            self.john.assign_role(Advisor, user)
+        self.run_on_commit()
+        self.assertTrue(self.john.has_permission('testapp1.change_user', users_list[0]))
+
+        with self.assertNumQueries(0):
+            for user in users_list:
+                cleanup_handler(MyUser, user, using='default')
+
+        # Rolled back deletions are not flushed.
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                MyUser.objects.filter(pk=self.bob.pk).delete()
+                raise ValueError
+        self.assertEqual(len(connection.run_on_commit), 1)
+
+        # One set-based delete for all objects.
+        with self.assertNumQueries(6):
+            self.run_on_commit()
+        self.assertFalse(UserRole.objects.filter(user=self.john).exists())
+        self.assertFalse(self.john.has_permission('testapp1.change_user', users_list[0]))
+
+    def test_sweep_orphan_roles(self):
+        """ test if the role instances of missing objects are removed """
+        from django.contrib.contenttypes.models import ContentType
+
+        self.john.assign_role(Advisor, self.bob)
+        ct_user = ContentType.objects.get_for_model(MyUser)
+        ct_gone = ContentType.objects.create(app_label='testapp1', model='gone')
+        UserRole(user=self.bob, role_class='advisor', content_type=ct_user, object_id=9999).save()
+        UserRole(user=self.bob, role_class='advisor', content_type=ct_gone, object_id=1).save()
+        self.bob.assign_role(Coordenator)
+
+        call_command('sweep_orphan_roles', '--dry-run', stdout=StringIO())
+        self.assertEqual(UserRole.objects.count(), 4)
+
+        output = StringIO()
+        call_command('sweep_orphan_roles', '--chunk-size', '1', stdout=output)
+        self.assertIn('2 orphan', output.getvalue())
+        self.assertEqual(UserRole.objects.count(), 2)
+        self.assertTrue(self.john.has_role(Advisor, self.bob))
+
+    def test_sweep_orphan_roles_inheritance(self):
+        """ test if the orphan roles of child models are removed """
+        class AppendixOwner(Role):
+            verbose_name = 'Appendix Owner'
+            models = [Appendix]
+            deny = []
+
+        RoleManager.register_role(AppendixOwner)
+        library = Library.objects.create(title='Library')
+        book = Book.objects.create(title='Book', library=library)
+        appendix = Appendix.objects.create(title='Appendix', book=book)
+        gone = Appendix.objects.create(title='Gone', book=book)
+        self.john.assign_role(AppendixOwner, appendix)
+        self.john.assign_role(AppendixOwner, gone)
+
+        # Deleting without the signals.
+        Appendix.objects.filter(pk=gone.pk)._raw_delete('default')
+
+        output = StringIO()
+        call_command('sweep_orphan_roles', stdout=output)
+        self.assertIn('1 orphan', output.getvalue())
+        self.assertTrue(self.john.has_role(AppendixOwner, appendix))
+        self.assertEqual(UserRole.objects.filter(role_class='appendixowner').count(), 1)
+
+    def test_cleanup_models(self):
+        """ test if only the models of the roles have the cleanup signal """
+        from django.contrib.auth.models import Group
+        from django.contrib.sessions.models import Session
+
+        # Coordenator uses ALL_MODELS, but it is
+        # never attached to an object.
+        self.assertTrue(post_delete.has_listeners(MyUser))
+        self.assertFalse(post_delete.has_listeners(Session))
+        self.assertFalse(post_delete.has_listeners(Book))
+
+        RoleManager.register_role(Author)
+        self.assertTrue(post_delete.has_listeners(Book))
+        self.assertFalse(post_delete.has_listeners(Session))
+
+        RoleManager.cleanup()
+        RoleManager.register_role(Coordenator)
+        self.assertFalse(post_delete.has_listeners(MyUser))
+
+        # No extra queries deleting unrelated objects.
+        group = Group.objects.create(name='group')
+        with CaptureQueriesContext(connection) as context:
+            group.delete()
+        self.assertFalse(any('improved_permissions' in query['sql'] for query in context.captured_queries))
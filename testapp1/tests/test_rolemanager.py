@@ -112,3 +112,96 @@ class RoleManagerTest(TestCase):
 
         # Checking list.
         self.assertEqual(RoleManager.get_roles(), [Advisor])
+
+    def test_role_policy(self):
+        """ test if the role classes are compiled properly """
+        from django.contrib.auth.models import Permission
+        from improved_permissions.exceptions import RoleNotFound
+        from improved_permissions.roles import ALLOW_MODE, DENY_MODE
+        from testapp1.roles import Coordenator, Reviewer
+
+        RoleManager.register_role(Reviewer)
+        RoleManager.register_role(Coordenator)
+
+        # The policy is found by the class and by its name.
+        policy = RoleManager.get_policy(Reviewer)
+        self.assertEqual(RoleManager.get_policy('reviewer'), policy)
+        self.assertEqual(policy.role, Reviewer)
+        self.assertEqual(policy.mode, ALLOW_MODE)
+        self.assertEqual(policy.allow, frozenset(['testapp1.review']))
+        self.assertEqual(policy.inherit_allow, frozenset(['testapp1.review']))
+
+        review = Permission.objects.get(codename='review')
+        add_book = Permission.objects.get(codename='add_book')
+        self.assertEqual(policy.get_ids('allow'), frozenset([review.id]))
+        self.assertTrue(policy.access_check(review.id))
+        self.assertFalse(policy.access_check(add_book.id))
+        self.assertTrue(policy.inherit_check('testapp1.review'))
+        self.assertFalse(policy.inherit_check('testapp1.add_book'))
+
+        # ALL_MODELS roles are always in inherit mode.
+        policy = RoleManager.get_policy(Coordenator)
+        self.assertEqual(policy.mode, DENY_MODE)
+        self.assertFalse(policy.inherit_check('testapp1.change_user'))
+        self.assertTrue(policy.inherit_check('testapp1.add_user'))
+
+        # Policies are immutable.
+        with self.assertRaises(AttributeError):
+            policy.ranking = 10
+
+        # Policies are rebuilt after a cleanup.
+        RoleManager.cleanup()
+        with self.assertRaises(RoleNotFound):
+            RoleManager.get_policy(Reviewer)
+
+        autodiscover()
+        self.assertEqual(RoleManager.get_policy(Reviewer).role, Reviewer)
+
+    def test_register_roles(self):
+        """ test if the registry changes all at once """
+        from improved_permissions.exceptions import RoleNotFound
+        from testapp1.roles import Coordenator, Reviewer
+
+        RoleManager.register_roles([Reviewer, Coordenator])
+        self.assertEqual(RoleManager.get_roles(), [Reviewer, Coordenator])
+        self.assertEqual(RoleManager.get_role('reviewer'), Reviewer)
+        self.assertEqual(RoleManager.get_role(Coordenator), Coordenator)
+
+        # A single invalid class keeps the previous registry.
+        with self.assertRaises(ImproperlyConfigured):
+            RoleManager.register_roles([Advisor, NoModelRole1], replace=True)
+        self.assertEqual(RoleManager.get_roles(), [Reviewer, Coordenator])
+        with self.assertRaises(RoleNotFound):
+            RoleManager.get_role(Advisor)
+
+        RoleManager.register_roles([Advisor], replace=True)
+        self.assertEqual(RoleManager.get_roles(), [Advisor])
+        with self.assertRaises(RoleNotFound):
+            RoleManager.get_role('reviewer')
+        with self.assertRaises(RoleNotFound):
+            RoleManager.get_role(['not hashable'])
+
+    def test_model_roles(self):
+        """ test if the models of the roles are indexed """
+        from django.contrib.contenttypes.models import ContentType
+        from testapp1.models import Book
+        from testapp1.roles import Author, Coordenator, Reviewer
+
+        RoleManager.register_roles([Author, Reviewer, Advisor, Coordenator])
+        self.assertEqual(RoleManager.get_model_roles(Book), [Author, Reviewer, Coordenator])
+        self.assertEqual(RoleManager.get_model_roles(MyUser), [Advisor, Coordenator])
+        self.assertEqual(RoleManager.get_model_roles('some data'), [])
+
+        # Using an instance or a ContentType id.
+        ct_book = ContentType.objects.get_for_model(Book)
+        book = Book(title='Book')
+        self.assertEqual(RoleManager.get_model_roles(book), [Author, Reviewer, Coordenator])
+        self.assertEqual(RoleManager.get_model_roles(ct_book.id), [Author, Reviewer, Coordenator])
+
+        self.assertTrue(Author.is_my_model(book))
+        self.assertFalse(Author.is_my_model(MyUser))
+        self.assertFalse(Author.is_my_model('some data'))
+        self.assertTrue(Coordenator.is_my_model(MyUser))
+
+        policy = RoleManager.get_policy(Reviewer)
+        self.assertEqual(policy.get_content_type_ids(), frozenset([ct_book.id]))
@@ -1,16 +1,24 @@
 """ permissions tests """
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 
 from improved_permissions.exceptions import (InvalidPermissionAssignment,
                                              InvalidRoleAssignment, NotAllowed)
 from improved_permissions.roles import ALL_MODELS, Role, RoleManager
 from improved_permissions.shortcuts import (assign_permission, assign_role,
-                                            assign_roles, get_user, get_users,
-                                            has_permission, has_role,
+                                            assign_roles, bulk_assign_roles,
+                                            get_user, get_users,
+                                            has_permission, has_role, has_roles,
                                             remove_all, remove_role,
                                             remove_roles)
 from improved_permissions.templatetags.roletags import get_role as tg_get_role
 from improved_permissions.templatetags.roletags import has_perm as tg_has_perm
+from improved_permissions.utils import dip_cache
 from testapp1.models import Chapter, MyUser, UniqueTogether
 
 
@@ -80,6 +88,131 @@ class ShortcutsTest(TestCase):
         with self.assertRaises(NotAllowed):
             assign_role(self.john, Teacher, Chapter)
 
+    def test_bulk_assign_roles(self):
+        """ test if the roles are assigned using a fixed number of queries """
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from improved_permissions.models import RolePermission, UserRole
+
+        users_list = [MyUser.objects.create(username='user%d' % i) for i in range(30)]
+        assign_role(self.john, Teacher, self.mike)
+        perms_count = RolePermission.objects.count()
+
+        queries = list()
+        for users_chunk, obj in [(users_list[:3], self.bob), (users_list, self.julie)]:
+            with CaptureQueriesContext(connection) as context:
+                assign_roles(users_chunk, Teacher, obj)
+            queries.append(len(context))
+        self.assertEqual(queries[0], queries[1])
+
+        # The cache of all users is cleaned at once.
+        cache = dip_cache()
+        with mock.patch.object(cache, 'delete_many', wraps=cache.delete_many) as delete_many, \
+                mock.patch.object(cache, 'incr', wraps=cache.incr) as incr:
+            assign_roles(users_list, Teacher, self.john)
+        self.assertEqual(delete_many.call_count, 1)
+        self.assertEqual(len(delete_many.call_args[0][0]), len(users_list))
+        self.assertEqual(incr.call_count, 0)
+        remove_roles(users_list, Teacher, self.john)
+
+        self.assertEqual(list(get_users(Teacher, self.julie)), users_list)
+        self.assertTrue(has_permission(users_list[-1], 'testapp1.change_user', self.julie))
+        self.assertFalse(has_permission(users_list[-1], 'testapp1.delete_user', self.julie))
+        roles_count = UserRole.objects.filter(role_class='teacher').count()
+        self.assertEqual(roles_count, 34)
+        self.assertEqual(RolePermission.objects.count() - perms_count,
+                         (roles_count - 1) * len(UserRole.get_accesses(Teacher)))
+
+        # Many objects at once.
+        bulk_assign_roles([self.john, self.mike], Secretary, [self.bob, self.julie, self.unique])
+        self.assertTrue(has_role(self.mike, Secretary, self.unique))
+        self.assertTrue(has_permission(self.john, 'testapp1.delete_user', self.julie))
+
+        # The whole batch is validated before any change.
+        with self.assertRaises(InvalidRoleAssignment):
+            bulk_assign_roles([self.julie, self.mike], UniqueOwner, [self.unique])
+        assign_role(self.john, Advisor, self.julie)
+        with self.assertRaises(InvalidRoleAssignment):
+            bulk_assign_roles([self.mike], Advisor, [self.john, self.bob, self.julie])
+        self.assertFalse(has_role(self.julie, UniqueOwner, self.unique))
+        self.assertFalse(has_role(self.mike, Advisor, self.bob))
+
+        # Errors undo the whole batch.
+        with self.assertRaises(InvalidRoleAssignment):
+            assign_roles([self.julie, users_list[0]], Teacher, self.bob)
+        self.assertFalse(has_role(self.julie, Teacher, self.bob))
+
+        # Other database errors are raised as they are.
+        with self.assertRaises(IntegrityError):
+            assign_roles([self.julie, MyUser(username='unsaved')], Teacher, self.bob)
+        self.assertFalse(has_role(self.julie, Teacher, self.bob))
+
+    def test_unique_rules_chunks(self):
+        """ test if the unique rules are checked in chunks of objects """
+        users_list = [MyUser.objects.create(username='user%d' % i) for i in range(5)]
+        assign_role(self.john, Advisor, users_list[-1])
+
+        with mock.patch('improved_permissions.assignments.has_unique_constraints', return_value=False), \
+                mock.patch('improved_permissions.assignments.CHUNK_SIZE', 2):
+            with self.assertRaises(InvalidRoleAssignment) as context:
+                bulk_assign_roles([self.mike], Advisor, users_list)
+            self.assertIn('marked as unique', str(context.exception))
+
+            bulk_assign_roles([self.mike], Advisor, users_list[:-1])
+        self.assertEqual(has_roles(self.mike, Advisor, users_list),
+                         {user.pk: user != users_list[-1] for user in users_list})
+
+    def test_unique_constraints(self):
+        """ test if the unique rules are enforced by the database """
+        from improved_permissions.models import UserRole
+
+        assign_role(self.mike, UniqueOwner, self.unique)
+        assign_role(self.john, Advisor, self.bob)
+
+        # Skipping the validation of the shortcuts.
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                UserRole(user=self.mike, role_class='secretary', obj=self.unique).save()
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                UserRole(user=self.julie, role_class='advisor', obj=self.bob).save()
+
+        # Other users and objects are not affected.
+        UserRole(user=self.julie, role_class='secretary', obj=self.unique).save()
+        UserRole(user=self.julie, role_class='advisor', obj=self.mike).save()
+        assign_roles([self.john, self.mike], Teacher, self.bob)
+
+        # The error is still reported as usual.
+        with self.assertRaises(InvalidRoleAssignment) as context:
+            assign_role(self.mike, Advisor, self.bob)
+        self.assertIn('marked as unique', str(context.exception))
+
+    def test_update_unique_marks(self):
+        """ test if the command recomputes the marks of the existing roles """
+        from improved_permissions.models import UserRole
+
+        assign_role(self.mike, UniqueOwner, self.unique)
+        assign_role(self.john, Advisor, self.bob)
+        assign_role(self.john, Teacher, self.bob)
+        UserRole.objects.update(unique_role=None, unique_object=None)
+
+        output = StringIO()
+        call_command('update_unique_marks', stdout=output)
+        self.assertIn('2 UserRole rows updated', output.getvalue())
+        self.assertEqual(UserRole.objects.get(role_class='advisor').unique_role, True)
+        self.assertEqual(UserRole.objects.get(role_class='uniqueowner').unique_object, True)
+        self.assertIsNone(UserRole.objects.get(role_class='teacher').unique_role)
+
+        # Teacher is no longer unique, but bob
+        # already has two teachers.
+        assign_role(self.mike, Teacher, self.bob)
+        with mock.patch.object(Teacher, 'unique', True):
+            RoleManager.cleanup()
+            RoleManager.register_roles([Advisor, Teacher, UniqueOwner])
+            with self.assertRaises(CommandError):
+                call_command('update_unique_marks', stdout=StringIO())
+        self.assertIsNone(UserRole.objects.get(user=self.john, role_class='teacher').unique_role)
+
     def test_assign_roles_allmodels(self):
         """ test if the roles using ALL_MODELS work fine """
         assign_role(self.john, Coordenator)
@@ -125,6 +258,28 @@ class ShortcutsTest(TestCase):
         users_list = get_users(Advisor)
         self.assertEqual(list(users_list), [self.john, self.mike])
 
+    def test_get_user_query(self):
+        """ test if get_user reads only the unique roles in one query """
+        users_list = [MyUser.objects.create(username='user%d' % i) for i in range(20)]
+        bulk_assign_roles(users_list, Teacher, [self.bob])
+
+        # No unique role attached.
+        with self.assertNumQueries(1):
+            self.assertIsNone(get_user(obj=self.bob))
+
+        # Not a unique role at all.
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_user(Teacher, self.bob))
+
+        assign_role(self.john, Advisor, self.bob)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_user(obj=self.bob), self.john)
+
+        assign_role(self.mike, Advisor, self.julie)
+        with self.assertNumQueries(1):
+            with self.assertRaises(NotAllowed):
+                get_user()
+
     def test_unique_together(self):
         """ test if models marked as unique_together works fine """
 
@@ -158,6 +313,47 @@ class ShortcutsTest(TestCase):
         with self.assertRaises(NotAllowed):
             has_role(self.john, Advisor, self.unique)
 
+    def test_has_role_queries(self):
+        """ test if has_role uses the object filter and the cache """
+        assign_role(self.john, Advisor, self.bob)
+        assign_role(self.john, Teacher, self.mike)
+
+        # The role on another object does not count.
+        self.assertFalse(has_role(self.john, Advisor, self.julie))
+        self.assertFalse(has_role(self.john, obj=self.julie))
+        self.assertTrue(has_role(self.john, Teacher))
+        self.assertFalse(has_role(self.bob))
+
+        # Checks of the same object come from the cache.
+        with self.assertNumQueries(1):
+            self.assertTrue(has_role(self.john, Advisor, self.bob))
+        with self.assertNumQueries(0):
+            self.assertTrue(has_role(self.john, obj=self.bob))
+            self.assertFalse(has_role(self.john, Teacher, self.bob))
+
+        # The cache follows the changes.
+        remove_role(self.john, Advisor, self.bob)
+        self.assertFalse(has_role(self.john, Advisor, self.bob))
+        self.assertFalse(has_role(self.john, Advisor))
+        assign_role(self.john, Advisor, self.julie)
+        self.assertTrue(has_role(self.john, Advisor))
+
+        # Many objects at once.
+        users_list = [MyUser.objects.create(username='user%d' % i) for i in range(10)]
+        bulk_assign_roles([self.john], Teacher, users_list[:5])
+        with self.assertNumQueries(1):
+            result = has_roles(self.john, Teacher, users_list + [self.mike])
+        expected = {user.pk: index < 5 for index, user in enumerate(users_list)}
+        expected[self.mike.pk] = True
+        self.assertEqual(result, expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(has_roles(self.john, Teacher, users_list + [self.mike]), expected)
+        self.assertEqual(has_roles(self.john, None, [self.julie, self.bob]),
+                         {self.julie.pk: True, self.bob.pk: False})
+
+        with self.assertRaises(NotAllowed):
+            has_roles(self.john, Advisor, [self.unique])
+
     def test_has_permission(self):
         """ test if the has_permission method works fine """
         assign_role(self.john, Teacher, self.bob)
@@ -223,6 +419,49 @@ class ShortcutsTest(TestCase):
         self.assertEqual(list(get_users(Coordenator)), [])
         self.assertEqual(list(get_users(Teacher)), [])
 
+    def test_bulk_remove_roles(self):
+        """ test if the roles are removed using a fixed number of queries """
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        users_list = [MyUser.objects.create(username='user%d' % i) for i in range(30)]
+        queries = list()
+        for users_chunk, obj in [(users_list[:3], self.bob), (users_list, self.julie)]:
+            assign_roles(users_chunk, Teacher, obj)
+            self.assertTrue(has_permission(users_chunk[-1], 'testapp1.change_user', obj))
+            with CaptureQueriesContext(connection) as context:
+                remove_all(Teacher, obj)
+            queries.append(len(context))
+            self.assertFalse(has_permission(users_chunk[-1], 'testapp1.change_user', obj))
+        self.assertEqual(queries[0], queries[1])
+
+        # The cache of each object is cleaned, even
+        # if the object is not provided.
+        assign_roles(users_list, Teacher, self.bob)
+        self.assertTrue(has_permission(users_list[0], 'testapp1.change_user', self.bob))
+        remove_roles(users_list, Teacher)
+        self.assertFalse(has_permission(users_list[0], 'testapp1.change_user', self.bob))
+
+        # The cache is cleaned again after the commit.
+        assign_role(self.john, Teacher, self.bob)
+        with mock.patch('django.db.transaction.on_commit') as on_commit:
+            remove_role(self.john, Teacher, self.bob)
+        self.assertEqual(on_commit.call_count, 1)
+
+        # Using the transaction of the database of the roles.
+        self.assertEqual(on_commit.call_args[1], {'using': 'default'})
+
+        # Each phase cleans the cache of all users at once.
+        assign_roles(users_list, Teacher, self.bob)
+        cache = dip_cache()
+        with mock.patch('django.db.transaction.on_commit', side_effect=lambda func, using: func()), \
+                mock.patch.object(cache, 'delete_many', wraps=cache.delete_many) as delete_many, \
+                mock.patch.object(cache, 'incr', wraps=cache.incr) as incr:
+            with transaction.atomic():
+                remove_all(Teacher)
+        self.assertEqual(delete_many.call_count, 2)
+        self.assertEqual(incr.call_count, 0)
+
     def test_assign_permissions(self):
         """ test if the permissions assignment works fine """
 
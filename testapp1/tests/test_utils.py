@@ -1,12 +1,20 @@
 """ utils tests """
+from django.db import models
 from django.test import TestCase
+from django.test.utils import isolate_apps
 
+from improved_permissions.checkers import (filter_queryset, has_permission,
+                                           has_permissions)
 from improved_permissions.exceptions import (ImproperlyConfigured,
                                              ParentNotFound, RoleNotFound)
-from improved_permissions.utils import (autodiscover, get_model, get_parents,
-                                        get_roleclass, is_unique_together,
-                                        string_to_permission)
-from testapp1.models import MyUser
+from improved_permissions.roles import Role, RoleManager
+from improved_permissions.shortcuts import assign_role
+from improved_permissions.utils import (autodiscover, clear_registry,
+                                        get_ancestors, get_many_ancestors,
+                                        get_model, get_object_key, get_parents,
+                                        get_parents_paths, get_permission_id,
+                                        get_roleclass, is_unique_together)
+from testapp1.models import MyUser, Section
 
 
 class FakeModel1(object):
@@ -44,3 +52,90 @@ class UtilsTest(TestCase):
 
         with self.assertRaises(ImproperlyConfigured):
             is_unique_together(FakeModel3)
+
+    @isolate_apps('testapp1')
+    def test_recursive_parents(self):
+        """ test if recursive parents are only accepted using a maximum depth """
+        class RecursiveModel(models.Model):
+            parent = models.ForeignKey('self', null=True, on_delete=models.CASCADE)
+
+            class RoleOptions:
+                permission_parents = ['parent']
+
+        with self.assertRaises(ImproperlyConfigured):
+            get_parents_paths(RecursiveModel)
+
+        paths_list = [path for path, model in get_parents_paths(RecursiveModel, 3)]
+        self.assertEqual(paths_list, ['', 'parent', 'parent__parent', 'parent__parent__parent'])
+
+    @isolate_apps('testapp1')
+    def test_property_parents(self):
+        """ test if parents which are not model fields use the instances """
+        class PropertyModel(models.Model):
+            class RoleOptions:
+                permission_parents = ['owner']
+
+            @property
+            def owner(self):
+                return MyUser.objects.get(username='john')
+
+        john = MyUser.objects.create(username='john')
+        obj = PropertyModel(pk=1)
+        self.assertEqual(list(get_ancestors(obj)), [get_object_key(john)])
+        self.assertEqual(get_many_ancestors([obj]), {get_object_key(obj): [get_object_key(john)]})
+
+    def test_recursive_instances(self):
+        """ test if the checks finish when the parents of the instances loop """
+        class SectionEditor(Role):
+            verbose_name = 'Section Editor'
+            models = [Section]
+            deny = []
+
+        RoleManager.cleanup()
+        RoleManager.register_role(SectionEditor)
+        self.addCleanup(RoleManager.cleanup)
+
+        john = MyUser.objects.create(username='john')
+        first = Section.objects.create(title='First')
+        second = Section.objects.create(title='Second', parent=first)
+        first.parent = second
+        first.save()
+
+        perm = 'testapp1.change_section'
+        self.assertFalse(has_permission(john, perm, first, persistent=True))
+
+        assign_role(john, SectionEditor, second)
+        self.assertTrue(has_permission(john, perm, first))
+        self.assertTrue(has_permission(john, perm, second))
+
+        # Compiling the parents into queries.
+        with self.settings(IMPROVED_PERMISSIONS_SETTINGS={'MAX_PARENTS_DEPTH': 3}):
+            self.assertTrue(has_permission(john, perm, first))
+            self.assertEqual(has_permissions(john, perm, [first, second]),
+                             {first.pk: True, second.pk: True})
+            result = filter_queryset(john, perm, Section.objects.all())
+            self.assertEqual(set(result), {first, second})
+
+    def test_permission_registry(self):
+        """ test if the permission strings are resolved by the process """
+        from django.contrib.auth.models import Permission
+        from django.contrib.contenttypes.models import ContentType
+
+        clear_registry()
+        with self.assertNumQueries(1):
+            perm_id = get_permission_id('testapp1.change_user')
+            for dummy in range(10):
+                self.assertEqual(get_permission_id('testapp1.change_user'), perm_id)
+        perm = Permission.objects.get(content_type__app_label='testapp1', codename='change_user')
+        self.assertEqual(perm_id, perm.id)
+
+        # New permissions are found on demand.
+        ct_obj = ContentType.objects.get_for_model(MyUser)
+        new_perm = Permission.objects.create(name='New', codename='new_perm', content_type=ct_obj)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_permission_id('testapp1.new_perm'), new_perm.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_permission_id('testapp1.new_perm'), new_perm.id)
+
+        with self.assertRaises(Permission.DoesNotExist):
+            get_permission_id('testapp1.i_do_not_exist')